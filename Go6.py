@@ -1,16 +1,24 @@
 #!/usr/bin/python3
 from mcts import MCTS
 from gtp_connection import GtpConnection
+from board_util import BLACK, WHITE
 import argparse
+import time
 import numpy as np
 
 parser = argparse.ArgumentParser(description='Process Arguments for number of simulation')
 parser.add_argument('-s', '--sim', type=int, nargs='?', default = 200, help='define number of simulations for each legal move, #playout --> sim*num_of_legal_moves')
+parser.add_argument('-w', '--workers', type=int, default=1, help='number of worker processes for parallel search')
+parser.add_argument('--ponder', action='store_true', help='keep searching while waiting for the next GTP command')
+parser.add_argument('--leaf-parallel', action='store_true', help='run only the rollouts in the workers and keep one shared tree (leaf parallel search)')
 args = parser.parse_args()
 num_simulation = args.sim
+num_workers = args.workers
+leaf_parallel = args.leaf_parallel
+pondering = args.ponder
 
 class Go6Player():
-    def __init__(self, num_simulation = 200, limit=100, exploration = 0.01):
+    def __init__(self, num_simulation = 200, limit=100, exploration = 0.01, num_workers = 1, leaf_parallel = False, pondering = False):
         """
         Player that selects a move based on MCTS from the set of legal moves
 
@@ -28,6 +36,20 @@ class Go6Player():
         self.num_simulation = num_simulation
         self.limit = limit
         self.exploration = exploration 
+        self.num_workers = num_workers
+        self.leaf_parallel = leaf_parallel
+        self.widening = True
+        self.transpositions = False
+        self.rave = False
+        self.weighted = False
+        # stone margin at which rollouts stop, None plays them to the end
+        self.mercy = None
+        self.pondering = pondering
+        # time control, set by the GTP commands time_settings and time_left
+        self.main_time = None
+        self.byo_yomi_time = 0
+        self.byo_yomi_stones = 0
+        self.clock = {}
         
     def policy(self,board,color):
         return GoBoardUtil.generate_move_with_filter(board,pattern,check_selfatari)
@@ -39,8 +61,9 @@ class Go6Player():
         self.MCTS.pattern = True
         self.MCTS.selfatari = True
 
+        board_copy = board.copy()
         for n in range(self.num_simulation):
-            board_copy = board.copy()
+            board.copy_into(board_copy)
             self.MCTS._playout(board_copy, color)
 
         if print_info:
@@ -52,19 +75,109 @@ class Go6Player():
     def update(self, move):
         self.MCTS.update_with_move(move)
 
+    def ponder(self, board, color, stop):
+        """
+        Run playouts on the current tree from board, with color to play, until the event stop is set.
+        GtpConnection calls this in a thread while it waits for the next command.
+        Root parallel search builds a new tree for every move, so it does not ponder.
+        """
+        if self.num_workers > 1 and not self.leaf_parallel:
+            return
+        self.MCTS.komi = self.komi
+        self.MCTS.limit = self.limit
+        self.MCTS.selfatari = self.selfatari
+        self.MCTS.pattern = self.pattern
+        self.MCTS.exploration = self.exploration
+        self.MCTS.widening = self.widening
+        self.MCTS.transpositions = self.transpositions
+        self.MCTS.rave = self.rave
+        self.MCTS.weighted = self.weighted
+        self.MCTS.mercy = self.mercy
+        self.MCTS.ponder(board, color, stop)
+
+    def time_settings(self, main_time, byo_yomi_time, byo_yomi_stones):
+        """
+        Set the time control of the game (Canadian byo-yomi as in GTP time_settings).
+        byo_yomi_time > 0 with byo_yomi_stones == 0 means no time limit, then every move
+        runs num_simulation playouts.
+        """
+        if byo_yomi_time > 0 and byo_yomi_stones == 0:
+            self.main_time = None
+        else:
+            self.main_time = main_time
+        self.byo_yomi_time = byo_yomi_time
+        self.byo_yomi_stones = byo_yomi_stones
+        self.clock = {BLACK: (main_time, 0), WHITE: (main_time, 0)}
+
+    def time_left(self, color, time_left, stones):
+        """
+        Set the clock of color: seconds left, and stones left in the byo-yomi period (0 in main time).
+        """
+        self.clock[color] = (time_left, stones)
+
+    def move_time_budget(self, board, color):
+        """
+        Return the seconds to spend on the next move of color, or None without time control.
+        In main time the time left is spread over half the empty points, the moves color is
+        expected to play; in byo-yomi the period is spread over the stones left in it.
+        A margin is kept for the overhead of the move. The budget can be 0 when the clock is
+        almost out, the search then runs only MCTS.min_playouts.
+        """
+        if self.main_time is None:
+            return None
+        time_left, stones = self.clock[color]
+        if stones > 0:
+            budget = time_left / stones
+        else:
+            budget = time_left / max(board.num_empty_points() / 2, 10)
+            if self.byo_yomi_stones > 0:
+                budget = max(budget, self.byo_yomi_time / self.byo_yomi_stones)
+        return max(0.0, 0.9 * budget - 0.05)
+
+    def use_time(self, color, seconds):
+        """
+        Take seconds off the clock of color, until the controller sends time_left again.
+        """
+        time_left, stones = self.clock[color]
+        time_left -= seconds
+        if stones > 0:
+            stones -= 1
+            if stones == 0:
+                # a new byo-yomi period
+                time_left, stones = self.byo_yomi_time, self.byo_yomi_stones
+        elif time_left <= 0 and self.byo_yomi_stones > 0:
+            time_left, stones = self.byo_yomi_time, self.byo_yomi_stones
+        self.clock[color] = (time_left, stones)
+
     def get_move(self, board, color):
+        start = time.time()
+        time_budget = self.move_time_budget(board, color)
+        if time_budget is None:
+            num_simulation = self.num_simulation
+        else:
+            num_simulation = None
         move = self.MCTS.get_move(board,
                 color,
                 komi=self.komi,
                 limit=self.limit,
                 selfatari=self.selfatari,
                 pattern=self.pattern,
-                num_simulation = self.num_simulation,
-                exploration = self.exploration)
+                num_simulation = num_simulation,
+                exploration = self.exploration,
+                num_workers = self.num_workers,
+                leaf_parallel = self.leaf_parallel,
+                widening = self.widening,
+                transpositions = self.transpositions,
+                rave = self.rave,
+                weighted = self.weighted,
+                mercy = self.mercy,
+                time_budget = time_budget)
+        if time_budget is not None:
+            self.use_time(color, time.time() - start)
         self.update(move)
         return move
 
 if __name__=='__main__':
-    c = GtpConnection(Go6Player(num_simulation))
+    c = GtpConnection(Go6Player(num_simulation, num_workers=num_workers, leaf_parallel=leaf_parallel, pondering=pondering))
     c.start_connection()
 
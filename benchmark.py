@@ -0,0 +1,451 @@
+#!/usr/bin/python3
+# Cmput 496 sample code
+# Micro benchmarks for the board and the playout policy
+# Run e.g. python3 benchmark.py -s 7 9 -g 200
+
+import argparse
+import contextlib
+import io
+import numpy as np
+import random
+import signal
+import time
+
+from board import GoBoard
+from board_util import GoBoardUtil, BLACK, WHITE, EMPTY
+from rollout import RolloutEngine
+from mcts import MCTS, PASS
+from pattern import pat3_eyeish_list
+
+def random_game(board, limit):
+    """
+    Play random moves directly through GoBoard.move until the board has no
+    more legal moves or the move limit is reached.
+    Returns the number of moves played.
+    """
+    color = BLACK
+    played = 0
+    for _ in range(limit):
+        empty = board.get_empty_points()
+        random.shuffle(empty)
+        for point in empty:
+            if board.move(point, color):
+                played += 1
+                break
+        else:
+            break
+        color = GoBoardUtil.opponent(color)
+    return played
+
+def bench_moves(size, num_games, limit):
+    """
+    Return the number of moves per second played by random_game on an empty board of the given size.
+    """
+    total = 0
+    start = time.time()
+    for _ in range(num_games):
+        board = GoBoard(size)
+        total += random_game(board, limit)
+    return total / (time.time() - start)
+
+def bench_rollouts(size, num_games, limit, pattern, selfatari):
+    """
+    Return the number of GoBoardUtil.playGame rollouts per second from an empty board of the given size.
+    """
+    start = time.time()
+    for _ in range(num_games):
+        board = GoBoard(size)
+        GoBoardUtil.playGame(board, BLACK, komi=6.5, limit=limit, selfatari=selfatari, pattern=pattern)
+    return num_games / (time.time() - start)
+
+def bench_light_rollouts(size, num_games, limit, pattern, selfatari, weighted=False):
+    """
+    Return the number of RolloutEngine rollouts per second from an empty board of the given size,
+    and the average number of moves per rollout.
+    """
+    engine = RolloutEngine()
+    num_moves = 0
+    start = time.time()
+    for _ in range(num_games):
+        engine.load(GoBoard(size))
+        _, played = engine.play_game(BLACK, komi=6.5, limit=limit, selfatari=selfatari, pattern=pattern,
+                                     record=True, weighted=weighted)
+        num_moves += len(played)
+    return num_games / (time.time() - start), num_moves / num_games
+
+def rollout_check(size, num_games, limit):
+    """
+    Play random games and assert that in every position the RolloutEngine generates the same
+    atari and pattern moves as GoBoardUtil, and agrees on legality, eyes, self-atari and score
+    for every empty point and both colors, and on only_eyes_left.
+    Also assert that with the same seed both play the same rollouts from the empty board,
+    with and without the mercy rule.
+    """
+    for mercy in (None, 8):
+        for _ in range(num_games):
+            state = random.getstate()
+            reference = GoBoardUtil.playGame(GoBoard(size), BLACK, komi=6.5, limit=limit, record=True, mercy=mercy)
+            random.setstate(state)
+            result = RolloutEngine(GoBoard(size)).play_game(BLACK, komi=6.5, limit=limit, record=True, mercy=mercy)
+            assert reference[0] == result[0] and (reference[1] == result[1]).all()
+    for _ in range(num_games):
+        board = GoBoard(size)
+        color = BLACK
+        for _ in range(limit):
+            engine = RolloutEngine(board)
+            assert engine.atari_moves() == GoBoardUtil.generate_atari_moves(board)[0]
+            assert engine.pattern_moves() == GoBoardUtil.generate_pattern_moves(board)
+            assert engine.only_eyes_left() == board.only_eyes_left()
+            legal = []
+            for point in board.get_empty_points():
+                assert (pat3_eyeish_list[board._pat3_code[point]] or None) == board._is_eyeish(point)
+                for c in (BLACK, WHITE):
+                    is_legal = board.check_legal(point, c)
+                    assert engine.is_legal(point, c) == is_legal
+                    assert engine.is_eye(point, c) == board.is_eye(point, c)
+                    if is_legal:
+                        assert engine.is_selfatari(point, c) == GoBoardUtil.selfatari(board, point, c)
+                        if c == color:
+                            legal.append(point)
+            assert engine.score(6.5) == board.score(6.5)
+            # mix policy moves with random ones, which also fill eyes and lead to more captures
+            move = GoBoardUtil.generate_move_with_filter(board, True, True)
+            if random.random() < 0.3:
+                move = random.choice(legal) if legal else None
+            assert board.move(move, color)
+            color = GoBoardUtil.opponent(color)
+
+def sampler_check(size, num_games, limit):
+    """
+    Play weighted rollouts move by move and assert that the incrementally updated gamma trees
+    of the RolloutEngine hold the same weights as trees built from scratch in the same position.
+    """
+    for _ in range(num_games):
+        engine = RolloutEngine(GoBoard(size))
+        engine.play_game(BLACK, limit=0, weighted=True)
+        for _ in range(limit):
+            move = engine.generate_move(True, True, weighted=True)
+            if move is None:
+                break
+            engine.play(move, engine.current_player)
+            trees = engine.trees
+            engine._build_trees()
+            for color in (BLACK, WHITE):
+                for a, b in zip(trees[color].weights, engine.trees[color].weights):
+                    assert abs(a - b) <= 1e-9 * max(1.0, abs(b))
+                assert abs(trees[color].total() - engine.trees[color].total()) <= 1e-6 * engine.trees[color].total() + 1e-9
+            engine.trees = trees
+
+def cutoff_comparison(size, num_games, limit, mercy, seed):
+    """
+    Play num_games RolloutEngine rollouts from the empty board to the end and the same number with
+    the mercy rule, game i of both from the random seed seed + i. The two rollouts of a seed play the
+    same moves until the cutoff, so the share of equal winners is how often stopping early keeps the
+    result. Returns the rollouts per second and the average number of moves of the full and the cut
+    rollouts, and the agreement rate.
+    """
+    engine = RolloutEngine()
+    rates = []
+    lengths = []
+    winners = []
+    for cutoff in (None, mercy):
+        num_moves = 0
+        results = []
+        elapsed = 0.0
+        for i in range(num_games):
+            random.seed(seed + i)
+            engine.load(GoBoard(size))
+            start = time.time()
+            winner, played = engine.play_game(BLACK, komi=6.5, limit=limit, record=True, mercy=cutoff)
+            elapsed += time.time() - start
+            num_moves += len(played)
+            results.append(winner)
+        rates.append(num_games / elapsed)
+        lengths.append(num_moves / num_games)
+        winners.append(results)
+    agreement = sum(a == b for a, b in zip(*winners)) / num_games
+    return rates, lengths, agreement
+
+def search_timeout(signum, frame):
+    raise AssertionError("the search did not finish in time")
+
+def transposition_check(size, num_games, limit, num_simulation=500, seconds=60):
+    """
+    Search endgame positions of random games, a few moves before the two passes, with transpositions
+    on and no widening, where passes lead back to positions already in the tree. Assert that every
+    search finishes within seconds (where signal.alarm is available) and that no descent holds a
+    node twice. Every other game is searched with positional superko, which must not link any nodes.
+    """
+    guard = hasattr(signal, 'SIGALRM')
+    if guard:
+        handler = signal.signal(signal.SIGALRM, search_timeout)
+    try:
+        for game in range(num_games):
+            _, played = GoBoardUtil.playGame(GoBoard(size), BLACK, komi=6.5, limit=limit, record=True)
+            board = GoBoard(size)
+            board.superko = game % 2 == 1
+            for point, color in played[:max(0, len(played) - random.randint(2, 10))].tolist():
+                assert board.move(point or None, color)
+            color = board.current_player
+            mcts = MCTS()
+            if guard:
+                signal.alarm(seconds)
+            with contextlib.redirect_stdout(io.StringIO()):
+                mcts.get_move(board, color, 6.5, limit, True, True, num_simulation, 0.4,
+                              transpositions=True, widening=False)
+            for _ in range(20):
+                path, _, _ = mcts._select_leaf(board.copy(), color)
+                assert len(set(path.tolist())) == len(path)
+            if board.superko:
+                assert (mcts._tree.link[:mcts._tree.size] < 0).all()
+            if guard:
+                signal.alarm(0)
+    finally:
+        if guard:
+            signal.alarm(0)
+            signal.signal(signal.SIGALRM, handler)
+
+def amaf_check(size, num_games, limit, num_playouts=50):
+    """
+    Grow RAVE search trees from positions of random games and assert, for num_playouts more
+    playouts on each, that NodeStore.update_amaf adds an AMAF visit to exactly the children whose
+    move was first played, from their parent on, by the player to move at the parent, counted by
+    walking the tree moves and the rollout move by move. Every other game uses transpositions.
+    """
+    for game in range(num_games):
+        board = GoBoard(size)
+        color = BLACK
+        for _ in range(random.randint(0, size * size // 2)):
+            move = GoBoardUtil.generate_move_with_filter(board, True, True)
+            assert board.move(move, color)
+            color = GoBoardUtil.opponent(color)
+        mcts = MCTS()
+        with contextlib.redirect_stdout(io.StringIO()):
+            mcts.get_move(board, color, 6.5, limit, True, True, 100, 0.4, widening=False, rave=True,
+                          transpositions=game % 2 == 1)
+        tree = mcts._tree
+        colors = [color, GoBoardUtil.opponent(color)]
+        for _ in range(num_playouts):
+            board_copy = board.copy()
+            path, moves, leaf_color = mcts._select_leaf(board_copy, color)
+            leaf_value, played = mcts._evaluate_rollout(board_copy, leaf_color, record=True)
+            before = tree.amaf_visits.copy()
+            before_wins = tree.amaf_black_wins.copy()
+            tree.update_amaf(path, moves, color, played, leaf_value, board.maxpoint)
+            sequence = [(move, colors[depth % 2]) for depth, move in enumerate(moves)] + played.tolist()
+            expected = np.zeros_like(before)
+            for depth, node in enumerate(path.tolist()):
+                first = {}
+                for move, c in sequence[depth:]:
+                    first.setdefault(move, c)
+                for child in tree.children(node):
+                    move = int(tree.move[child])
+                    if move != PASS and first.get(move) == colors[depth % 2]:
+                        expected[tree.resolve(child)] += 1
+            assert (tree.amaf_visits - before == expected).all()
+            assert (tree.amaf_black_wins - before_wins == expected * leaf_value).all()
+            tree.update_path(path, leaf_value)
+
+def eyes_board(size):
+    """
+    Return a board filled with black stones except for single point eyes at every third row and
+    column, so that black only has its own eyes left to fill and white only suicides: pass is forced.
+    """
+    board = GoBoard(size)
+    for row in range(1, size + 1):
+        for col in range(1, size + 1):
+            if row % 3 != 2 or col % 3 != 2:
+                assert board.move(board._coord_to_point(row, col), BLACK)
+    return board
+
+def pass_check(size, num_simulation=200):
+    """
+    Assert that MCTS.get_move passes in a forced pass position with plenty of playouts and no time
+    control, and that MCTS._best_move replaces a barely visited pass by another move only when a
+    time budget cut the search short.
+    """
+    board = eyes_board(size)
+    for color in (BLACK, WHITE):
+        mcts = MCTS()
+        with contextlib.redirect_stdout(io.StringIO()):
+            move = mcts.get_move(board, color, 6.5, 100, True, True, num_simulation, 0.4)
+        assert move is None
+    # a root where pass has the most visits after a minimal search
+    mcts = MCTS()
+    tree = mcts._tree
+    first = tree.allocate(2)
+    tree.first_child[mcts._root] = first
+    tree.num_children[mcts._root] = 2
+    tree.move[first:first + 2] = [PASS, board._coord_to_point(1, 1)]
+    tree.visits[first:first + 2] = [mcts.min_playouts - 2, 2]
+    mcts.num_playouts = mcts.min_playouts
+    assert mcts._best_move() == PASS
+    assert mcts._best_move(time_budget=1.0) == board._coord_to_point(1, 1)
+
+def liberties_by_play(board, point, color, stone):
+    """
+    Reference for GoBoard._liberties_after: play the move, count the liberties of the block
+    of stone and take the move back. Returns None if the move is illegal.
+    """
+    if not board.push_move(point, color):
+        return None
+    num_libs = board._liberty(stone, color)
+    board.pop_move()
+    return num_libs
+
+def tactics_check(size, num_games, limit):
+    """
+    Play random games and assert that GoBoardUtil.selfatari, runaway
+    and counterattack, which compute liberties without playing, agree with trying every move
+    on the board, for every empty point and both colors.
+    """
+    for _ in range(num_games):
+        board = GoBoard(size)
+        color = BLACK
+        for _ in range(limit):
+            legal = []
+            for point in board.get_empty_points():
+                for c in (BLACK, WHITE):
+                    num_libs = liberties_by_play(board, point, c, point)
+                    if num_libs is None:
+                        assert not GoBoardUtil.selfatari(board, point, c)
+                        assert GoBoardUtil.runaway(board, point, c) is None
+                        continue
+                    assert board._liberties_after(point, c, point) == num_libs
+                    assert GoBoardUtil.selfatari(board, point, c) == (num_libs == 1)
+                    assert GoBoardUtil.runaway(board, point, c) == (point if num_libs > 1 else None)
+                    if c == color:
+                        legal.append(point)
+            for point in board._geometry.points:
+                c = board.get_color(point)
+                if c != BLACK and c != WHITE:
+                    continue
+                expected = []
+                for n in board._neighbors(point):
+                    if board.get_color(n) == GoBoardUtil.opponent(c):
+                        lib = board._single_liberty(n, GoBoardUtil.opponent(c))
+                        if lib:
+                            num_libs = liberties_by_play(board, lib, c, point)
+                            if num_libs is not None:
+                                assert board._liberties_after(lib, c, point) == num_libs
+                                if num_libs > 1:
+                                    expected.append(lib)
+                assert GoBoardUtil.counterattack(board, point) == expected
+            move = random.choice(legal) if legal and random.random() > 0.02 else None
+            assert board.move(move, color)
+            color = GoBoardUtil.opponent(color)
+
+def flood_block(board, point):
+    """
+    Return the set of stones of the block at point, found by a flood fill.
+    """
+    color = board.get_color(point)
+    block = {point}
+    todo = [point]
+    while todo:
+        for n in board._neighbors(todo.pop()):
+            if n not in block and board.get_color(n) == color:
+                block.add(n)
+                todo.append(n)
+    return block
+
+def check_liberty_index(board):
+    """
+    Assert that board.blocks_with_liberties agrees with a flood fill of every block.
+    Blocks are compared by their smallest point, whatever anchor the board uses.
+    """
+    for color in (BLACK, WHITE):
+        expected = {1: {}, 2: {}}
+        seen = set()
+        for point in board._geometry.points:
+            if board.get_color(point) != color or point in seen:
+                continue
+            block = flood_block(board, point)
+            seen |= block
+            libs = {n for s in block for n in board._neighbors(s) if board.get_color(n) == EMPTY}
+            if 0 < len(libs) <= 2:
+                expected[len(libs)][min(block)] = libs
+        for num_libs in (1, 2):
+            found = {min(flood_block(board, anchor)): set(libs)
+                     for anchor, libs in board.blocks_with_liberties(color, num_libs).items()}
+            assert found == expected[num_libs]
+
+def undo_check(size, num_games, limit):
+    """
+    Play random games and assert after every move that the liberties of every block and the
+    index of blocks with one and two liberties agree with a flood fill, also on a copy of the board,
+    and that trying a move and taking it back with push_move/pop_move restores the board, the empty
+    points, the hash and the index.
+    """
+    for _ in range(num_games):
+        board = GoBoard(size)
+        color = BLACK
+        for _ in range(limit):
+            legal = [point for point in board.get_empty_points() if board.check_legal(point, color)]
+            for point in board._geometry.points:
+                c = board.get_color(point)
+                if c == BLACK or c == WHITE:
+                    block = flood_block(board, point)
+                    num_libs = len({n for s in block for n in board._neighbors(s) if board.get_color(n) == EMPTY})
+                    assert board._liberty_point(point, c)[0] == num_libs
+            if legal and random.random() < 0.2:
+                state = (board.board.copy(), board.get_empty_points(), board.zobrist_hash(), board.ko_constraint)
+                assert board.push_move(random.choice(legal), color)
+                check_liberty_index(board)
+                board.pop_move()
+                assert (board.board == state[0]).all()
+                assert (board.get_empty_points(), board.zobrist_hash(), board.ko_constraint) == state[1:]
+            move = random.choice(legal) if legal and random.random() > 0.02 else None
+            assert board.move(move, color)
+            check_liberty_index(board)
+            check_liberty_index(board.copy())
+            color = GoBoardUtil.opponent(color)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Board and playout benchmarks')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[7, 9], help='board sizes to benchmark')
+    parser.add_argument('-g', '--games', type=int, default=100, help='number of games per board size')
+    parser.add_argument('-l', '--limit', type=int, default=200, help='maximum number of moves per game')
+    parser.add_argument('--check', action='store_true', help='run the consistency checks on random games first')
+    parser.add_argument('--seed', type=int, default=1, help='random seed')
+    parser.add_argument('--mercy', type=int, nargs='+', default=[],
+                        help='stone margins for the rollout cutoff comparison, default a quarter of the board')
+    args = parser.parse_args()
+    for size in args.sizes:
+        if args.check:
+            random.seed(args.seed)
+            undo_check(size, args.games // 10 + 1, args.limit)
+            print("{}x{}: undo check passed".format(size, size))
+            random.seed(args.seed)
+            rollout_check(size, args.games // 10 + 1, args.limit)
+            print("{}x{}: rollout engine check passed".format(size, size))
+            random.seed(args.seed)
+            sampler_check(size, args.games // 10 + 1, args.limit)
+            print("{}x{}: weighted sampler check passed".format(size, size))
+            random.seed(args.seed)
+            tactics_check(size, args.games // 10 + 1, args.limit)
+            print("{}x{}: tactics check passed".format(size, size))
+            random.seed(args.seed)
+            transposition_check(size, args.games // 10 + 1, args.limit)
+            print("{}x{}: transposition check passed".format(size, size))
+            random.seed(args.seed)
+            amaf_check(size, args.games // 10 + 1, args.limit)
+            print("{}x{}: AMAF check passed".format(size, size))
+            pass_check(size)
+            print("{}x{}: pass check passed".format(size, size))
+        random.seed(args.seed)
+        print("{}x{} moves per second: {:.0f}".format(size, size,
+              bench_moves(size, args.games, args.limit)))
+        random.seed(args.seed)
+        print("{}x{} rollouts per second: {:.1f}".format(size, size,
+              bench_rollouts(size, args.games, args.limit, True, True)))
+        for weighted in (False, True):
+            random.seed(args.seed)
+            rate, length = bench_light_rollouts(size, args.games, args.limit, True, True, weighted)
+            print("{}x{} light{} rollouts per second: {:.1f}, {:.1f} moves, {:.1f} us per move".format(
+                  size, size, " weighted" if weighted else "", rate, length, 1e6 / (rate * length)))
+        for mercy in args.mercy or [size * size // 4]:
+            (full_rate, rate), (full_length, length), agreement = cutoff_comparison(
+                size, args.games, args.limit, mercy, args.seed)
+            print("{}x{} light rollouts with mercy {}: {:.1f} vs {:.1f} per second, {:.1f} vs {:.1f} moves, "
+                  "{:.1%} same winner".format(size, size, mercy, rate, full_rate, length, full_length, agreement))
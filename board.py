@@ -13,11 +13,91 @@ glossary:
 """
 
 import numpy as np
-import copy
+import random
 from board_util import GoBoardUtil, BLACK, WHITE, EMPTY, BORDER, FLOODFILL
+from pattern import pat3_eyeish_list
+
+ZOBRIST_SEED = 366
+_zobrist_tables = {}
+
+def zobrist_table(maxpoint):
+    """
+    Return the random 64 bit keys used for hashing boards with maxpoint points.
+    The keys are generated once per board size from a fixed seed, so all boards of a size
+    (and all processes) agree on the hash of a position.
+    Returns
+    -------
+    (stone_keys, ko_keys, white_to_play_key): stone_keys[color][point] and ko_keys[point] are ints
+    """
+    if maxpoint not in _zobrist_tables:
+        rng = random.Random(ZOBRIST_SEED + maxpoint)
+        stone_keys = {color: [rng.getrandbits(64) for _ in range(maxpoint)] for color in (BLACK, WHITE)}
+        ko_keys = [rng.getrandbits(64) for _ in range(maxpoint)]
+        _zobrist_tables[maxpoint] = (stone_keys, ko_keys, rng.getrandbits(64))
+    return _zobrist_tables[maxpoint]
+
+class GoBoardGeometry(object):
+    """
+    Tables which only depend on the board size: neighbors, diagonal neighbors, coordinates, line numbers
+    and distances of all points. They are built once per size by board_geometry and shared by all boards
+    of that size, so none of the lists or arrays may be modified.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.NS = size + 1
+        self.maxpoint = size*size + 3*(size+1)
+        NS = self.NS
+        # points inside the board, in increasing order
+        self.points = [row*NS + col for row in range(1, size+1) for col in range(1, size+1)]
+        self.neighbors = [[p-1, p+1, p-NS, p+NS] for p in range(self.maxpoint)]
+        self.diag_neighbors = [[p-NS-1, p-NS+1, p+NS-1, p+NS+1] for p in range(self.maxpoint)]
+        # 3x3 neighborhood in the order used by neighborhood_33
+        self.neighbors_33 = [[p-NS-1, p-NS, p-NS+1, p-1, p, p+1, p+NS-1, p+NS, p+NS+1]
+                             for p in range(self.maxpoint)]
+        # the 8 points around p as used by the 3x3 pattern codes, see pattern.py
+        self.neighbors_8 = [n[:4] + n[5:] for n in self.neighbors_33]
+        self.row = [p // NS for p in range(self.maxpoint)]
+        self.col = [p % NS for p in range(self.maxpoint)]
+        # line of the point counted from the closest edge, 1 is the first line (0 off the board)
+        half_size = (size + 1)/2
+        self.line = [0] * self.maxpoint
+        for p in self.points:
+            line_row = size + 1 - self.row[p] if self.row[p] > half_size else self.row[p]
+            line_col = size + 1 - self.col[p] if self.col[p] > half_size else self.col[p]
+            self.line[p] = min(line_row, line_col)
+        # index arrays for vectorized lookups, off the board entries are clipped into the array
+        self.points_array = np.array(self.points, dtype=np.intp)
+        self.neighbors_array = np.clip(np.array(self.neighbors, dtype=np.intp), 0, self.maxpoint - 1)
+        self.points_neighbors_array = self.neighbors_array[self.points_array]
+        self.diag_neighbors_array = np.clip(np.array(self.diag_neighbors, dtype=np.intp), 0, self.maxpoint - 1)
+        self.row_array = np.array(self.row, dtype=np.intp)
+        self.col_array = np.array(self.col, dtype=np.intp)
+        self.line_array = np.array(self.line, dtype=np.intp)
+        # distance d(dx,dy) = |dx|+|dy|+max(|dx|,|dy|) between all pairs of points
+        dx = np.abs(self.col_array[:, None] - self.col_array[None, :])
+        dy = np.abs(self.row_array[:, None] - self.row_array[None, :])
+        self.distance = dx + dy + np.maximum(dx, dy)
+
+_geometries = {}
+
+def board_geometry(size):
+    """
+    Return the shared GoBoardGeometry of the given board size, building it on first use.
+    """
+    if size not in _geometries:
+        _geometries[size] = GoBoardGeometry(size)
+    return _geometries[size]
 
 class GoBoard(object):
 
+    __slots__ = ('name', 'version', 'size', 'NS', 'WE', 'check_suicide', 'superko', '_is_empty',
+                 'ko_constraint', 'passes_white', 'passes_black', 'white_captures', 'black_captures',
+                 'current_player', 'winner', '_empty_points', '_empty_index', 'maxpoint', 'moves',
+                 'last_move', 'last2_move', 'last3_move', 'captured_stones',
+                 '_block_of', '_block_stones', '_block_libs', '_block_changes', '_undo_stack', '_low_libs',
+                 '_zobrist', '_hash', '_hash_history', '_geometry', '_pat3_code', 'board')
+
     def move(self, point, color):
         """
             Play a move on the board.
@@ -26,32 +106,68 @@ class GoBoard(object):
             Return:
             color
         """
+        return self.push_move(point, color)
+
+    def push_move(self, point, color):
+        """
+        Play a move and record everything it changes on the undo stack, so that pop_move
+        can take it back.
+        Arguments
+        ---------
+        point, color
+
+        Return
+        ---------
+        bool: whether the move was legal and has been played
+        """
+        record = (point, self._hash, self.ko_constraint, self._is_empty, self.captured_stones,
+                  self.white_captures, self.black_captures, self.passes_white, self.passes_black,
+                  self.current_player, self.winner, self.last_move, self.last2_move, self.last3_move)
+        self._block_changes = {}
         move_inspection, msg = self._play_move(point,color)
         if not move_inspection:
             return False
-        else:
-            self.current_player = GoBoardUtil.opponent(color)
-            self.last3_move = self.last2_move
-            self.last2_move = self.last_move
-            self.last_move = point
-            self.moves.append(point)
-            self.winner = None
+        self._undo_stack.append((record, self._block_changes))
+        if point != None:
+            self._hash_history[self._hash] = self._hash_history.get(self._hash, 0) + 1
+        self.current_player = GoBoardUtil.opponent(color)
+        self.last3_move = self.last2_move
+        self.last2_move = self.last_move
+        self.last_move = point
+        self.moves.append(point)
+        self.winner = None
         return True
 
-    # not a full implementation of undo, just usable for a quick 1 step back
+    def pop_move(self):
+        """
+        Take back the last move played with push_move (or move) and restore the board,
+        the block table, the ko point, the pass counters and the last-move history.
+        """
+        record, block_changes = self._undo_stack.pop()
+        point = record[0]
+        self.moves.pop()
+        if point != None:
+            count = self._hash_history[self._hash]
+            if count == 1:
+                del self._hash_history[self._hash]
+            else:
+                self._hash_history[self._hash] = count - 1
+            opp_color = GoBoardUtil.opponent(self.board[point])
+            self._clear_stone(point)
+            for p in self.captured_stones:
+                self._set_stone(p, opp_color)
+            self._undo_blocks(point, block_changes)
+        (_, self._hash, self.ko_constraint, self._is_empty, self.captured_stones,
+         self.white_captures, self.black_captures, self.passes_white, self.passes_black,
+         self.current_player, self.winner, self.last_move, self.last2_move, self.last3_move) = record
+
     def partial_undo_move(self):
-        if len(self.moves) == 0:
+        """
+        Undo the last move. Kept for the callers of the old one step undo, it is the same as pop_move.
+        """
+        if len(self._undo_stack) == 0:
             return
-        self.last_move = self.last2_move
-        self.last2_move = self.last3_move
-        last_point = self.moves.pop()
-        if last_point != None:
-            self.board[last_point] = EMPTY
-            if len(self.captured_stones)>0:
-                c = self.current_player
-                for p in self.captured_stones:
-                    self.board[p] = c
-        self.current_player = GoBoardUtil.opponent(self.current_player);
+        self.pop_move()
     
     @staticmethod
     def showboard(board,bd_size):
@@ -77,10 +193,44 @@ class GoBoard(object):
             Whether the playing point with the given color is
             legal.
         """
-        cboard = self.copy()
-        # swap out true board for simulation board, and try to play the move
-        result, _ = cboard._play_move(point, color)
-        return result
+        if point == None:
+            return True
+        if self.board[point] != EMPTY or point == self.ko_constraint:
+            return False
+        if self.check_suicide and self._is_suicide(point, color):
+            return False
+        return not (self.superko and self._is_superko(point, color))
+
+    def zobrist_hash(self):
+        """
+        Return the 64 bit Zobrist hash of the position, including the player to move and the ko point.
+        The stone part is kept up to date by every move, so this is a constant time query.
+        """
+        _, ko_keys, white_to_play_key = self._zobrist
+        h = self._hash
+        if self.current_player == WHITE:
+            h ^= white_to_play_key
+        if self.ko_constraint != None:
+            h ^= ko_keys[self.ko_constraint]
+        return h
+
+    def _is_superko(self, point, color):
+        """
+        Return True if playing color at the empty point recreates a position that occurred before
+        in this game (positional superko). Only the stones are compared, not the player to move.
+        """
+        stone_keys = self._zobrist[0]
+        opp_color = GoBoardUtil.opponent(color)
+        h = self._hash ^ stone_keys[color][point]
+        captured = []
+        for n in self._neighbors(point):
+            if self.board[n] == opp_color:
+                a = self._block_of[n]
+                if a not in captured and len(self._block_libs[a]) == 1:
+                    captured.append(a)
+                    for s in self._block_stones[a]:
+                        h ^= stone_keys[opp_color][s]
+        return h in self._hash_history
 
     def final_score(self,komi):
         """
@@ -95,20 +245,7 @@ class GoBoard(object):
                 0 indicates a draw
         This function is based on https://github.com/Rochester-NRT/RocAlphaGo/blob/develop/AlphaGo/go.py --> get_winner
         """
-        # Count number of positions filled by each player, plus 1 for each eye-ish space owned
-        score = np.sum(self.board == BLACK)
-        score -= np.sum(self.board == WHITE)
-        empties = list(*np.where(self.board == EMPTY))
-        for empty in empties:
-            # Check if all surrounding points are of one color
-            color = self._is_eyeish(empty)
-            if color == BLACK:
-                score += 1
-            elif color == WHITE:
-                score -= 1
-        score -= komi
-        score += self.passes_white
-        score -= self.passes_black
+        score = self.score(komi)
         result = "0"
         if score > 0:
             self.winner = BLACK
@@ -120,6 +257,26 @@ class GoBoard(object):
             self.winner = EMPTY
         return result
 
+    def score(self, komi):
+        """
+        Return the area score of the board as the margin of black over white, komi and passes included.
+        The colors of all points and of their neighbors are gathered with the geometry index array
+        and counted with a single bincount, so there is no Python loop over the empty points.
+        """
+        geometry = self._geometry
+        points = self.board[geometry.points_array]
+        # bit 1 << color is set if a neighbor has that color; BORDER is dropped by the & 7
+        neighbor_colors = np.bitwise_or.reduce(1 << self.board[geometry.points_neighbors_array], axis=1) & 7
+        # count the points by their own color and the colors around them in one pass
+        counts = np.bincount(points * 8 + neighbor_colors, minlength=24)
+        black_stones = int(counts[8*BLACK:8*BLACK+8].sum())
+        white_stones = int(counts[8*WHITE:8*WHITE+8].sum())
+        # empty points surrounded only by black (or only by white) are eye-ish
+        black_eyes = int(counts[8*EMPTY + (1 << BLACK)])
+        white_eyes = int(counts[8*EMPTY + (1 << WHITE)])
+        score = black_stones - white_stones + black_eyes - white_eyes
+        return score - komi + self.passes_white - self.passes_black
+
     def get_winner(self,komi):
         """
         Returns:
@@ -142,13 +299,21 @@ class GoBoard(object):
 
         
     def get_empty_points(self):
-        moves = []
-        for x in range(1,self.size+1):
-            for y in range(1,self.size+1):
-                point = self._coord_to_point(x,y)
-                if self.get_color(point) == EMPTY:
-                    moves.append(point)
-        return moves
+        """
+        Return a new list of all empty points in increasing order.
+        """
+        return sorted(self._empty_points)
+
+    def num_empty_points(self):
+        return len(self._empty_points)
+
+    def random_empty_point(self):
+        """
+        Return an empty point chosen uniformly at random, or None if the board is full.
+        """
+        if not self._empty_points:
+            return None
+        return self._empty_points[random.randrange(len(self._empty_points))]
         
     def filleye_filter(self, point):
         return self.is_eye(point,self.current_player)
@@ -182,6 +347,7 @@ class GoBoard(object):
         self.NS = size + 1
         self.WE=  1
         self.check_suicide = True # check for suicidal moves
+        self.superko = False # forbid moves that repeat an earlier position
         self._is_empty = True
         self.ko_constraint = None
         self.passes_white = 0
@@ -190,13 +356,23 @@ class GoBoard(object):
         self.black_captures = 0
         self.current_player= BLACK
         self.winner = None
-        self._empty_positions = {BLACK:[],WHITE:[]}
-        self.maxpoint = size*size + 3*(size+1)  # Zero indexing
+        self._geometry = board_geometry(size)
+        self.maxpoint = self._geometry.maxpoint  # Zero indexing
         self.moves = []
         self.last_move = None
         self.last2_move = None
         self.last3_move = None
         self.captured_stones = []
+        self._block_of = [None] * self.maxpoint
+        self._block_stones = {}
+        self._block_libs = {}
+        # blocks with one and with two liberties of each color: _low_libs[color][num_libs] maps anchor to libs
+        self._low_libs = {BLACK: [None, {}, {}], WHITE: [None, {}, {}]}
+        self._block_changes = {}
+        self._undo_stack = []
+        self._zobrist = zobrist_table(self.maxpoint)
+        self._hash = 0 # Zobrist hash of the stones on the board
+        self._hash_history = {self._hash: 1} # number of times each stone hash occurred in the game
         
         """
         The array is one-dimensional and this representation is achieved through _coord_to_point function
@@ -224,16 +400,96 @@ class GoBoard(object):
         """
         self.board = np.ones((self.maxpoint),dtype=np.int16)*BORDER
         self._empty_filling(self.board) 
+        # unordered list of the empty points and the position of every point in it (-1 if not empty)
+        self._empty_points = self._geometry.points[:]
+        self._empty_index = [-1] * self.maxpoint
+        for i, p in enumerate(self._empty_points):
+            self._empty_index[p] = i
+        # 3x3 pattern code of every point, see pattern.py
+        self._pat3_code = [0] * self.maxpoint
+        for p in self._geometry.points:
+            for i, n in enumerate(self._geometry.neighbors_8[p]):
+                self._pat3_code[p] |= int(self.board[n]) << (2 * i)
 
 
     def copy(self):
         """Return an independent copy of this Board."""
-        b = GoBoard(self.size)
-        b.__dict__ = copy.deepcopy(self.__dict__)
-        assert b.board.all() == self.board.all()
-        assert vars(b)==vars(b)
+        b = self.__class__.__new__(self.__class__)
+        b.board = self.board.copy()
+        self._copy_state(b)
         return b
 
+    def copy_into(self, dst):
+        """
+        Make dst an independent copy of this board, reusing the board array of dst when the sizes match.
+        A search can keep one scratch board and copy the root position into it for every simulation.
+        """
+        if dst.board.shape == self.board.shape:
+            np.copyto(dst.board, self.board)
+        else:
+            dst.board = self.board.copy()
+        self._copy_state(dst)
+
+    def _copy_state(self, dst):
+        """
+        Copy everything but the board array into dst.
+        The stone lists and liberty sets of the block table, the undo records and the Zobrist keys are
+        never changed in place, so only the containers holding them are copied.
+        """
+        dst.name = self.name
+        dst.version = self.version
+        dst.size = self.size
+        dst.NS = self.NS
+        dst.WE = self.WE
+        dst.check_suicide = self.check_suicide
+        dst.superko = self.superko
+        dst._is_empty = self._is_empty
+        dst.ko_constraint = self.ko_constraint
+        dst.passes_white = self.passes_white
+        dst.passes_black = self.passes_black
+        dst.white_captures = self.white_captures
+        dst.black_captures = self.black_captures
+        dst.current_player = self.current_player
+        dst.winner = self.winner
+        dst._empty_points = self._empty_points[:]
+        dst._empty_index = self._empty_index[:]
+        dst.maxpoint = self.maxpoint
+        dst.moves = self.moves[:]
+        dst.last_move = self.last_move
+        dst.last2_move = self.last2_move
+        dst.last3_move = self.last3_move
+        dst.captured_stones = self.captured_stones
+        dst._block_of = self._block_of[:]
+        dst._block_stones = self._block_stones.copy()
+        dst._block_libs = self._block_libs.copy()
+        dst._low_libs = {color: [None, index[1].copy(), index[2].copy()] for color, index in self._low_libs.items()}
+        dst._block_changes = {}
+        dst._undo_stack = self._undo_stack[:]
+        dst._zobrist = self._zobrist
+        dst._geometry = self._geometry
+        dst._hash = self._hash
+        dst._hash_history = self._hash_history.copy()
+        dst._pat3_code = self._pat3_code[:]
+
+
+    def __getstate__(self):
+        """
+        Pickle the state of the board without the geometry and zobrist tables, which are shared
+        by all boards of a size and rebuilt by __setstate__.
+        This keeps the boards sent to worker processes small.
+        """
+        state = {}
+        for cls in type(self).__mro__:
+            for slot in getattr(cls, '__slots__', ()):
+                if slot not in ('_geometry', '_zobrist') and hasattr(self, slot):
+                    state[slot] = getattr(self, slot)
+        return state
+
+    def __setstate__(self, state):
+        for slot, value in state.items():
+            setattr(self, slot, value)
+        self._geometry = board_geometry(self.size)
+        self._zobrist = zobrist_table(self.maxpoint)
 
     def _empty_filling(self,board):
         """
@@ -244,9 +500,7 @@ class GoBoard(object):
             receives a numpy array filled with BORDER
 
         """
-        for ind in range(1,self.size+1,1):
-            indices = [j for j in range(ind*self.NS + 1,ind*self.NS+self.size+1,1)]
-            np.put(board,indices, EMPTY)
+        board[self._geometry.points_array] = EMPTY
 
 
     def is_eye(self,point,color):
@@ -281,6 +535,20 @@ class GoBoard(object):
         if false_count >= 2:
             return None
         return eye_color    
+
+    def only_eyes_left(self):
+        """
+        Return True if every empty point is surrounded by stones of a single color and no block
+        is in atari. Then no move can capture, the opponent stones in an eye would be suicide,
+        so the area score can only change if a player fills its own eyes.
+        Used to end rollouts early, see GoBoardUtil.playGame.
+        """
+        eyeish = pat3_eyeish_list
+        codes = self._pat3_code
+        for p in self._empty_points:
+            if not eyeish[codes[p]]:
+                return False
+        return not (self.blocks_with_liberties(BLACK, 1) or self.blocks_with_liberties(WHITE, 1))
     
         
     """
@@ -337,7 +605,21 @@ class GoBoard(object):
 
     def _liberty_point(self, point, color):
         """
-        Underlying function for returning number of liberty and last liberty for the point
+        Underlying function for returning number of liberty and last liberty for the point.
+        Stones of the given color are looked up in the block table, so this is a constant time query.
+        """
+        if self.board[point] == color:
+            libs = self._block_libs[self._block_of[point]]
+            if len(libs) == 1:
+                for single_lib_point in libs:
+                    return 1, single_lib_point
+            return len(libs), None
+        return self._liberty_point_flood(point, color)
+
+    def _liberty_point_flood(self, point, color):
+        """
+        Count liberties by walking the board from point. Only used when point does not hold
+        a stone of the given color, so it is not covered by the block table.
         """
         group_points = [point]
         liberty=0
@@ -360,56 +642,254 @@ class GoBoard(object):
             return liberty, single_lib_point
         return liberty, None
 
-    def _liberty_flood(self,board):
+    """
+    ----------------------------------------------------------------------------------------------------------------------
+    block table
+    Every stone belongs to a block identified by its anchor point. _block_of maps a point to the anchor
+    of its block (None for empty points), _block_stones and _block_libs map an anchor to the stones and
+    the liberty set of the block. The lists and sets stored in the tables are never modified in place,
+    a changed block always gets new objects, so the undo stack only has to keep the old objects.
+    ----------------------------------------------------------------------------------------------------------------------
+    """
+    def _is_suicide(self, point, color):
         """
-        This function find the liberties of flood filled board.
-        return True if it finds any liberty and False otherwise
-        Arguments
-        ---------
-        board : numpy array
-
-        Return
-        ---------
-        bool:
-             whether the flood filled group in the board has any liberty
+        Return True if playing color at the empty point leaves its block without liberty
+        and does not capture anything.
         """
-        #cond = board==FLOODFILL
-        #inds = np.where(cond)
-        inds = list(*np.where(board == FLOODFILL))
-        for f in inds:
-            f_neighbors = self._neighbors(f)
-            found_liberties = board[f_neighbors]==EMPTY
-            if found_liberties.any():
-                return True
-        return False
+        for n in self._neighbors(point):
+            c = self.board[n]
+            if c == EMPTY:
+                return False
+            if c == BORDER:
+                continue
+            libs = self._block_libs[self._block_of[n]]
+            if c == color:
+                if len(libs) > 1:
+                    return False
+            elif len(libs) == 1:
+                return False
+        return True
 
+    def _liberties_after(self, point, color, stone):
+        """
+        Return the number of liberties the block of stone would have after color plays the legal
+        move at point, computed from the block table without playing the move.
+        stone is point itself or a stone of color.
+        """
+        opp_color = GoBoardUtil.opponent(color)
+        own = []
+        captured = []
+        empties = []
+        for n in self._neighbors(point):
+            c = self.board[n]
+            if c == EMPTY:
+                empties.append(n)
+            elif c == color:
+                if self._block_of[n] not in own:
+                    own.append(self._block_of[n])
+            elif c == opp_color:
+                a = self._block_of[n]
+                if a not in captured and len(self._block_libs[a]) == 1:
+                    captured.append(a)
+        if stone == point or self._block_of[stone] in own:
+            # the block of the new stone
+            libs = set(empties)
+            for a in own:
+                libs |= self._block_libs[a]
+            libs.discard(point)
+            block = own
+            new_stone = point
+        else:
+            block = [self._block_of[stone]]
+            libs = self._block_libs[block[0]]
+            new_stone = None
+        if captured:
+            # captured stones next to the block become its liberties
+            libs = set(libs)
+            for a in captured:
+                for s in self._block_stones[a]:
+                    for n in self._neighbors(s):
+                        if n == new_stone or self._block_of[n] in block:
+                            libs.add(s)
+                            break
+        return len(libs)
+
+    def _add_empty(self, point):
+        self._empty_index[point] = len(self._empty_points)
+        self._empty_points.append(point)
+
+    def _remove_empty(self, point):
+        # move the last empty point into the slot of the removed one
+        i = self._empty_index[point]
+        last = self._empty_points.pop()
+        if last != point:
+            self._empty_points[i] = last
+            self._empty_index[last] = i
+        self._empty_index[point] = -1
+
+    def _set_stone(self, point, color):
+        """
+        Put a stone on the empty point, keeping the hash and the empty point list up to date.
+        The block table is not touched.
+        """
+        self.board[point] = color
+        self._hash ^= self._zobrist[0][color][point]
+        self._remove_empty(point)
+        # point is neighbor 7 - i of its i-th neighbor
+        codes = self._pat3_code
+        color = int(color)
+        shift = 14
+        for n in self._geometry.neighbors_8[point]:
+            codes[n] += color << shift
+            shift -= 2
+
+    def _clear_stone(self, point):
+        """
+        Take the stone off the point, keeping the hash and the empty point list up to date.
+        The block table is not touched.
+        """
+        color = int(self.board[point])
+        self._hash ^= self._zobrist[0][color][point]
+        self.board[point] = EMPTY
+        self._add_empty(point)
+        codes = self._pat3_code
+        shift = 14
+        for n in self._geometry.neighbors_8[point]:
+            codes[n] -= color << shift
+            shift -= 2
+
+    def _undo_blocks(self, point, block_changes):
+        """
+        Put back the block table entries saved while the move at point was played.
+        """
+        self._block_of[point] = None
+        for anchor, (stones, libs) in block_changes.items():
+            if stones is None:
+                del self._block_stones[anchor]
+                self._del_block_libs(anchor)
+                continue
+            self._block_stones[anchor] = stones
+            self._set_block_libs(anchor, self.board[stones[0]], libs)
+            if self._block_of[stones[0]] != anchor:
+                for s in stones:
+                    self._block_of[s] = anchor
 
-    def _flood_fill(self, point):
+    def _save_block(self, anchor):
         """
-        Creates a new board and fills the connected groups to the given point
-        Arguments
-        ---------
-        point
+        Remember the table entry of the block before the current move changes it, so that pop_move
+        can put it back. Anchors without a block are saved as None.
+        """
+        if anchor not in self._block_changes:
+            self._block_changes[anchor] = (self._block_stones.get(anchor), self._block_libs.get(anchor))
 
-        Return
-        ---------
-         a new board with points in the neighbor of given point with same color replaced with
-         FLOODFILL(=4)
-         This is based on https://github.com/pasky/michi/blob/master/michi.py --> floodfill
-        """
-        fboard = np.array(self.board, copy=True)
-        flood_list=[point]
-        color = fboard[point]
-        fboard[point] = FLOODFILL
-        while flood_list:
-            current_point = flood_list.pop()
-            neighbors = self._neighbors(current_point)
-            for n in neighbors :
-                if fboard[n] == color:
-                    fboard[n] = FLOODFILL
-                    flood_list.append(n)
-        return fboard
+    def _update_blocks(self, point, color):
+        """
+        Put a stone of color on the empty point, merge it with the neighbor blocks of the same color
+        and remove the opponent blocks which lost their last liberty.
+        Returns
+        -------
+        captured : list of lists of int
+            stones of every captured block
+        """
+        own = []
+        opp = []
+        libs = set()
+        for n in self._neighbors(point):
+            c = self.board[n]
+            if c == EMPTY:
+                libs.add(n)
+            elif c != BORDER:
+                a = self._block_of[n]
+                if c == color:
+                    if a not in own:
+                        own.append(a)
+                elif a not in opp:
+                    opp.append(a)
+        self._set_stone(point, color)
+
+        # merge into the largest neighbor block so that only the smaller blocks are relabeled
+        anchor = point
+        stones = [point]
+        if own:
+            anchor = max(own, key=lambda a: len(self._block_stones[a]))
+            stones = stones + self._block_stones[anchor]
+            libs |= self._block_libs[anchor]
+            for a in own:
+                self._save_block(a)
+                if a == anchor:
+                    continue
+                for s in self._block_stones[a]:
+                    self._block_of[s] = anchor
+                stones += self._block_stones.pop(a)
+                libs |= self._block_libs[a]
+                self._del_block_libs(a)
+            libs.discard(point)
+        else:
+            self._save_block(anchor)
+        self._block_of[point] = anchor
+        self._block_stones[anchor] = stones
+        self._set_block_libs(anchor, color, libs)
+
+        captured = []
+        opp_color = GoBoardUtil.opponent(color)
+        for a in opp:
+            self._save_block(a)
+            opp_libs = self._block_libs[a] - {point}
+            if opp_libs:
+                self._set_block_libs(a, opp_color, opp_libs)
+            else:
+                captured.append(self._remove_block(a))
+        return captured
 
+    def _remove_block(self, anchor):
+        """
+        Take the block off the board and give its points as liberties to the neighbor blocks.
+        Returns the stones of the block.
+        """
+        self._save_block(anchor)
+        stones = self._block_stones.pop(anchor)
+        self._del_block_libs(anchor)
+        for s in stones:
+            self._clear_stone(s)
+            self._block_of[s] = None
+        gained = {}
+        for s in stones:
+            for n in self._neighbors(s):
+                a = self._block_of[n]
+                if a is not None:
+                    gained.setdefault(a, set()).add(s)
+        for a, points in gained.items():
+            self._save_block(a)
+            self._set_block_libs(a, self.board[a], self._block_libs[a] | points)
+        return stones
+
+    def _set_block_libs(self, anchor, color, libs):
+        """
+        Store the liberty set of the block of color with the given anchor, and move the block to
+        the index of blocks with one or two liberties if it has that many.
+        """
+        self._block_libs[anchor] = libs
+        index = self._low_libs[color]
+        if anchor in index[1]:
+            del index[1][anchor]
+        elif anchor in index[2]:
+            del index[2][anchor]
+        if 0 < len(libs) <= 2:
+            index[len(libs)][anchor] = libs
+
+    def _del_block_libs(self, anchor):
+        del self._block_libs[anchor]
+        for index in self._low_libs.values():
+            index[1].pop(anchor, None)
+            index[2].pop(anchor, None)
+
+    def blocks_with_liberties(self, color, num_libs):
+        """
+        Return the blocks of color with exactly num_libs (1 or 2) liberties, as a dict from the anchor
+        of the block (one of its stones) to its liberty set. The index is kept up to date as moves
+        are played and taken back, so this is a constant time query. The dict must not be modified.
+        """
+        return self._low_libs[color][num_libs]
 
     def _play_move(self,point, color):
         """
@@ -434,50 +914,34 @@ class GoBoard(object):
         if point == self.ko_constraint:
             msg ="KO move is not permitted!"
             return False , msg
+        c = self._point_to_coord(point)
+        if self.check_suicide and self._is_suicide(point, color):
+            msg = "Suicide move with color %s in the row and column: %d %d "%(color, c[0],c[1])
+            return False, msg
+        if self.superko and self._is_superko(point, color):
+            msg = "Positional superko violation with color %s in the row and column: %d %d "%(color, c[0],c[1])
+            return False, msg
         in_enemy_eye = self._is_eyeish(point) == GoBoardUtil.opponent(color)
-        self.board[point] = color
         self._is_empty = False
         self.captured_stones = []
         single_captures = []
-        cap_inds = None
-        neighbors = self._neighbors(point)
-        for n in neighbors:
-            if self.board[n]==BORDER:
-                continue
-            if self.board[n]!=color:
-                if self.board[n]!=EMPTY:
-                    fboard = self._flood_fill(n)
-                    if not self._liberty_flood(fboard):
-                        cap_inds = fboard==FLOODFILL
-                        self.captured_stones += list(*np.where(fboard==FLOODFILL))
-                        num_captures = np.sum(cap_inds)
-                        if num_captures == self.size*self.size:
-                            self._is_empty = True
-                        if num_captures == 1:
-                            single_captures.append(n)
-                        if color==WHITE:
-                            self.white_captures += num_captures
-                        else :
-                            self.black_captures += num_captures
-                        self.board[cap_inds]=EMPTY
-        fboard = self._flood_fill(point)
+        for stones in self._update_blocks(point, color):
+            self.captured_stones += stones
+            num_captures = len(stones)
+            if num_captures == self.size*self.size:
+                self._is_empty = True
+            if num_captures == 1:
+                single_captures.append(stones[0])
+            if color==WHITE:
+                self.white_captures += num_captures
+            else :
+                self.black_captures += num_captures
         self.ko_constraint = single_captures[0] if in_enemy_eye and len(single_captures) == 1 else None
         if not self.check_suicide:
             msg = "NO SUICIDE CHECKING. Playing a move with %s color in the row and column %d %d is permitted"%(color,c[0],c[1])
             return True, msg
-        if self._liberty_flood(fboard):
-            #non suicidal move
-            c=self._point_to_coord(point)
-            msg = "Playing a move with %s color in the row and column %d %d is permitted"%(color,c[0],c[1])
-            return True, msg
-        else:
-            # undoing the move because of being suicidal
-            self.board[point] = EMPTY
-            if cap_inds!= None:
-                self.board[cap_inds]=GoBoardUtil.opponent(color)
-            c = self._point_to_coord(point)
-            msg = "Suicide move with color %s in the row and column: %d %d "%(color, c[0],c[1])
-            return False, msg
+        msg = "Playing a move with %s color in the row and column %d %d is permitted"%(color,c[0],c[1])
+        return True, msg
 
 
     def _neighbors(self,point):
@@ -490,9 +954,10 @@ class GoBoard(object):
         Returns
         -------
         points : list of int
-            coordinate of points which are neighbors of the given point
+            coordinate of points which are neighbors of the given point.
+            The list is shared by all boards of this size and must not be modified.
         """
-        return [point-1, point+1, point-self.NS, point+self.NS]
+        return self._geometry.neighbors[point]
 
 
     def _diag_neighbors(self,point):
@@ -505,10 +970,10 @@ class GoBoard(object):
         Returns
         -------
         points : list of int
-            coordinate of points which are diagnoal neighbors of the given point
+            coordinate of points which are diagnoal neighbors of the given point.
+            The list is shared by all boards of this size and must not be modified.
         """
-
-        return [point-self.NS-1, point-self.NS+1, point+self.NS-1, point+self.NS+1]
+        return self._geometry.diag_neighbors[point]
 
     def neighborhood_33(self,point):
         """
@@ -518,10 +983,7 @@ class GoBoard(object):
         patterns :
         Set of patterns in the same format of what michi pattern base provides. Please refer to pattern.py to see the format of the pattern.
         """
-        positions = [point-self.NS-1, point-self.NS, point-self.NS+1,
-                     point-1, point, point+1,
-                     point+self.NS-1, point+self.NS, point+self.NS+1]
-                     
+        positions = self._geometry.neighbors_33[point]
         pattern = ""
         for d in positions:
             if self.board[d] == self.current_player:
@@ -534,6 +996,12 @@ class GoBoard(object):
                 pattern += ' '
         return pattern
     
+    def pattern_code(self, point):
+        """
+        Return the integer 3x3 pattern code of the point, see pattern.py.
+        """
+        return self._pat3_code[point]
+
     def neighborhood_33_pattern_shape(self, point):
         """
         Find local pattern shape around point.
@@ -652,7 +1120,9 @@ class GoBoard(object):
         return self.NS*row + col
 
     def _point_to_coord(self,point):
-        return GoBoardUtil.point_to_coord(point, self.NS)
+        if point is None:
+            return 'pass'
+        return self._geometry.row[point], self._geometry.col[point]
 
     def point_to_string(self, point):
         if point == None:
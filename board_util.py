@@ -4,7 +4,7 @@ WHITE = 2
 BORDER = 3
 FLOODFILL = 4
 import numpy as np
-from pattern import pat3set
+from pattern import pat3_match_table
 
 import sys
 import random
@@ -13,13 +13,26 @@ class GoBoardUtil(object):
     
     @staticmethod       
     def playGame(board, color, **kwargs):
+        """
+        Play a rollout from board with color to move and return the winner.
+        With record=True return the winner and the moves played, as an int16 array with one
+        (point, color) row per move; a pass is recorded as point 0.
+        With mercy=n the rollout ends early, once one color has n stones more on the board than
+        the other (the mercy rule) or once board.only_eyes_left(), and the board is scored as it is.
+        """
         komi = kwargs.pop('komi', 0)
         limit = kwargs.pop('limit', 1000)
         check_selfatari = kwargs.pop('selfatari', True)
         pattern = kwargs.pop('pattern', True)
+        record = kwargs.pop('record', False)
+        mercy = kwargs.pop('mercy', None)
         if kwargs:
             raise TypeError('Unexpected **kwargs: %r' % kwargs)
+        if mercy:
+            # stone margin of black over white, updated with the stones played and captured
+            margin = int(np.count_nonzero(board.board == BLACK)) - int(np.count_nonzero(board.board == WHITE))
         numPass = 0
+        played = []
         for _ in range(limit):
             move = GoBoardUtil.generate_move_with_filter(board,pattern,check_selfatari)
             if move != None:
@@ -28,13 +41,24 @@ class GoBoardUtil(object):
                     print("color {} move {} and board\n {} not legal,,,,".format(color ,move,board.get_twoD_board()))
                 assert isLegalMove
                 numPass = 0
+                if record:
+                    played.append((move, color))
+                if mercy:
+                    gain = 1 + len(board.captured_stones)
+                    margin += gain if color == BLACK else -gain
+                    if abs(margin) >= mercy or board.only_eyes_left():
+                        break
             else:
                 board.move(move,color)
                 numPass += 1
+                if record:
+                    played.append((0, color))
                 if numPass == 2:
                     break
             color = GoBoardUtil.opponent(color)
         winner = board.get_winner(komi)
+        if record:
+            return winner, np.array(played, dtype=np.int16).reshape(-1, 2)
         return winner
     
     @staticmethod
@@ -67,9 +91,10 @@ class GoBoardUtil(object):
     @staticmethod
     def generate_pattern_moves(board):
         pattern_checking_set = board.last_moves_empty_neighbors()
+        match_table = pat3_match_table[board.current_player]
         moves = []
         for p in pattern_checking_set:
-            if (board.neighborhood_33(p) in pat3set):
+            if match_table[board.pattern_code(p)]:
                 assert p not in moves
                 assert board.board[p] == EMPTY
                 moves.append(p)
@@ -81,10 +106,14 @@ class GoBoardUtil(object):
         opp_color = GoBoardUtil.opponent(color)
         if not board.last_move:
             return [],"None"
-        last_lib_point = board._single_liberty(board.last_move, opp_color)
-        if last_lib_point: #When num of liberty is 1 for last point we will get this point
-            if board.check_legal(last_lib_point,color):
-                return [last_lib_point],"AtariCapture"
+        # the board index of blocks in atari tells when there is nothing to capture or to save
+        if board.blocks_with_liberties(opp_color, 1):
+            last_lib_point = board._single_liberty(board.last_move, opp_color)
+            if last_lib_point: #When num of liberty is 1 for last point we will get this point
+                if board.check_legal(last_lib_point,color):
+                    return [last_lib_point],"AtariCapture"
+        if not board.blocks_with_liberties(color, 1):
+            return [],"AtariDefense"
         moves = GoBoardUtil.atari_defence(board, board.last_move, color)
         return moves,"AtariDefense"
 
@@ -177,6 +206,12 @@ class GoBoardUtil(object):
     @staticmethod
     def generate_random_move(board):
         color = board.current_player
+        # Sample straight from the board's empty point list first. Most empty points are
+        # legal non-eye moves, so this usually succeeds without building a candidate list.
+        for _ in range(min(10, board.num_empty_points())):
+            move = board.random_empty_point()
+            if board.check_legal(move, color) and not board.is_eye(move, color):
+                return move
         moves = board.get_empty_points()
         while len(moves) > 0:
             index = random.randint(0,len(moves) - 1)
@@ -249,15 +284,20 @@ class GoBoardUtil(object):
     
     @staticmethod
     def runaway(board, point, color):
-        cboard = board.copy()
-        if cboard.move(point, color):
-            if cboard._liberty(point,color) > 1:
-                return point
-            else:
-                return None
+        """
+        Return point if playing it gives the block in atari more than one liberty, None otherwise.
+        The liberties after the move are computed by the board without playing it.
+        """
+        if board.check_legal(point, color) and board._liberties_after(point, color, point) > 1:
+            return point
+        return None
             
     @staticmethod
     def counterattack(board, point):
+        """
+        Return the moves capturing an opponent block next to the stone at point which leave
+        the block of point with more than one liberty.
+        """
         color = board.board[point]
         opp_color = GoBoardUtil.opponent(color)
         moves = []
@@ -265,10 +305,9 @@ class GoBoardUtil(object):
             if board.board[n] == opp_color:
                 opp_single_lib = board._single_liberty(n, opp_color)
                 if opp_single_lib:
-                    cboard = board.copy()
-                    if cboard.move(opp_single_lib, color):
-                        if cboard._liberty(point, color) > 1:
-                            moves.append(opp_single_lib)
+                    if (board.check_legal(opp_single_lib, color)
+                            and board._liberties_after(opp_single_lib, color, point) > 1):
+                        moves.append(opp_single_lib)
         return moves
     
     @staticmethod
@@ -297,17 +336,13 @@ class GoBoardUtil(object):
     
     @staticmethod
     def selfatari(board, move, color):
+        """
+        Return True if the legal move of color leaves its block with a single liberty.
+        """
         max_old_liberty = GoBoardUtil.blocks_max_liberty(board, move, color, 2)
         if max_old_liberty > 2:
             return False
-        cboard = board.copy()
-        # swap out true board for simulation board, and try to play the move
-        isLegal = cboard.move(move, color) 
-        if isLegal:               
-            new_liberty = cboard._liberty(move,color)
-            if new_liberty==1:
-                return True 
-        return False
+        return board.check_legal(move, color) and board._liberties_after(move, color, move) == 1
 
     @staticmethod
     def blocks_max_liberty(board, point, color, limit):
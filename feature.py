@@ -2,8 +2,7 @@ import numpy as np
 import os
 from board_util import GoBoardUtil, BLACK, WHITE, EMPTY, BORDER, FLOODFILL
 from board import GoBoard
-from pattern import pat3set
-from pattern import patIndex
+from pattern import pat3_index_table
 
 NUM_SIMPLE_FEATURE = 26
 
@@ -94,15 +93,20 @@ class Feature(object):
             features[point].append(feature)
     
     @staticmethod
-    def find_all_features(board):
+    def find_all_features(board, moves=None):
         """
         Find all move's features on the board
+        moves are the points to find the features of, by default all legal moves that do not fill an eye.
+        Passing the empty points skips the legality checks.
         """
-        legal_moves = GoBoardUtil.generate_legal_moves(board, board.current_player)
-        filter_moves=[]
-        for m in legal_moves:
-            if GoBoardUtil.filleye_filter(board, m, board.current_player) !=True:
-                filter_moves.append(m)
+        if moves is None:
+            legal_moves = GoBoardUtil.generate_legal_moves(board, board.current_player)
+            filter_moves=[]
+            for m in legal_moves:
+                if GoBoardUtil.filleye_filter(board, m, board.current_player) !=True:
+                    filter_moves.append(m)
+        else:
+            filter_moves = moves
         features = {}
         features["PASS"] = []
         for m in filter_moves:
@@ -139,73 +143,20 @@ class Feature(object):
 
     @staticmethod
     def find_pattern_feature(features, board, point):
-        p = board.neighborhood_33(point)
-        if p in pat3set:
-            Feature.set_feature(features, point, patIndex[p]+NUM_SIMPLE_FEATURE)
-
-    @staticmethod
-    def find_block_anchors(board, limit):
-        """
-        Find all blocks with liberty less or equal to limit on the board. Anchors is the smallest point in a block.
-        Return a list of anchors and corresponding liberties
-        Not efficient. One could maintain all blocks and anchors on the board, and update it when a move is played.
-        """
-        anchors = []
-        liberty_dic = {}
-        anchor_dic = {}
-        
-        for x in range(1,board.size+1):
-            for y in range(1,board.size+1):
-                point = board._coord_to_point(x,y)
-                color = board.get_color(point)
-                if point in anchor_dic:
-                    continue
-                if color != WHITE and color != BLACK:
-                    continue
-                liberty = 0
-                the_libs = []
-                group_points = [point]
-                block_points = [point]
-                min_index = point
-                while group_points:
-                    current_point = group_points.pop()
-                    neighbors = board._neighbors(current_point)
-                    for n in neighbors :
-                        if n not in block_points:
-                            if board.get_color(n) == BORDER:
-                                continue
-                            if board.get_color(n) == color:
-                                group_points.append(n)
-                                block_points.append(n)
-                                if n < min_index:
-                                    min_index = n
-                            elif board.get_color(n) == EMPTY:
-                                if n not in the_libs:
-                                    the_libs.append(n)
-                                    liberty += 1
-                    if liberty > limit:
-                        break
-                for p in block_points:
-                    anchor_dic[p] = min_index
-                if liberty <= limit:
-                    anchors.append(min_index)
-                    liberty_dic[min_index] = the_libs
-    
-        return anchors, liberty_dic
+        index = pat3_index_table[board.current_player][board.pattern_code(point)]
+        if index >= 0:
+            Feature.set_feature(features, point, int(index)+NUM_SIMPLE_FEATURE)
 
     @staticmethod
     def find_full_board_features(features, board):
-        anchors, liberty_dic = Feature.find_block_anchors(board, 2)
-        for a in anchors:
-            num_lib = len(liberty_dic[a])
-            assert num_lib <= 2
-            color = board.get_color(a)
-            if num_lib == 1 and GoBoardUtil.opponent(board.current_player) == color: #find capture feature
-                theLib = liberty_dic[a][0]
+        # opponent blocks in atari and with two liberties, read from the index kept by the board
+        opp_color = GoBoardUtil.opponent(board.current_player)
+        for a, libs in board.blocks_with_liberties(opp_color, 1).items(): #find capture feature
+            for theLib in libs:
                 Feature.find_capture_features(features, board, a, theLib)
-            if num_lib == 2 and GoBoardUtil.opponent(board.current_player) == color: #find atari feature
-                for l in liberty_dic[a]:
-                    Feature.find_atari_features(features, board, a, l)
+        for a, libs in board.blocks_with_liberties(opp_color, 2).items(): #find atari feature
+            for l in libs:
+                Feature.find_atari_features(features, board, a, l)
 
     @staticmethod
     def find_atari_features(features, board, anchor, theLib):
@@ -236,24 +187,17 @@ class Feature(object):
     def distance(board, p1, p2):
         assert p1 != None
         assert p2 != None
-        row1, col1 = board._point_to_coord(p1)
-        row2, col2 = board._point_to_coord(p2)
-        dx = abs(col1 - col2)
-        dy = abs(row1 - row2)
-        return dx + dy + max(dx, dy)
+        return int(board._geometry.distance[p1, p2])
 
     @staticmethod
     def distance_to_line(board, p):
-        halfSize = (board.size + 1)/2
-        row, col = board._point_to_coord(p)
-        lineRow = board.size + 1 - row if row > halfSize else row
-        lineCol = board.size + 1 - col if col > halfSize else col
-        return min(lineRow, lineCol)
+        return board._geometry.line[p]
 
     @staticmethod
     def set_distance_last_move(features, board, legal_moves):
+        distances = board._geometry.distance[board.last_move].tolist()
         for move in legal_moves:
-            d = Feature.distance(board, move, board.last_move)
+            d = distances[move]
             assert d >= 2
             if d <= 9:
                 fe = Feature.compute_feature("FE_DIST_PREV_2", 2, d)
@@ -261,8 +205,9 @@ class Feature(object):
 
     @staticmethod
     def set_distance_2nd_last_move(features, board, legal_moves):
+        distances = board._geometry.distance[board.last2_move].tolist()
         for move in legal_moves:
-            d = Feature.distance(board, move, board.last2_move)
+            d = distances[move]
             if d == 0:
                 Feature.set_feature(features, move, FeBasicFeatures["FE_DIST_PREV_OWN_0"])
             elif d <= 9:
@@ -7,6 +7,7 @@ by Isaac Henrion and Amos Storkey at the University of Edinburgh.
 import traceback
 import sys
 import os
+import threading
 from board import GoBoard
 from board_util import GoBoardUtil, BLACK, WHITE, EMPTY, BORDER, FLOODFILL
 import numpy as np
@@ -42,7 +43,15 @@ class GtpConnection():
         self.skip_counter = 0
         self.param_options = {
             "selfatari" :  self.go_engine.selfatari,
-            "pattern" : self.go_engine.pattern
+            "pattern" : self.go_engine.pattern,
+            "superko" : 0,
+            "leaf_parallel" : 0,
+            "widening" : 1,
+            "transpositions" : 0,
+            "rave" : 0,
+            "weighted" : 0,
+            "mercy" : 0,
+            "ponder" : int(self.go_engine.pondering)
         }
         self.commands = {
             "protocol_version": self.protocol_version_cmd,
@@ -65,6 +74,9 @@ class GtpConnection():
             "go_param": self.go_param_cmd,
             "gogui-analyze_commands": self.gogui_analyze_cmd,
             "num_sim": self.num_sim_cmd,
+            "num_workers": self.num_workers_cmd,
+            "time_settings": self.time_settings_cmd,
+            "time_left": self.time_left_cmd,
             "showoptions": self.showoptions_cmd,
             "feature_move": self.feature_move_cmd,
             "features_mm_file": self.feature_mm_cmd
@@ -82,6 +94,9 @@ class GtpConnection():
             "legal_moves": (0, 'Usage: legal_moves does not have arguments'),
             "go_param": (2,'Usage: goparam {{{0}}} {{0,1}}'.format(' '.join(list(self.param_options.keys())))),
             "num_sim":(1,'Usage: num_sim #(e.g. num_sim 100 )'),
+            "num_workers":(1,'Usage: num_workers #(e.g. num_workers 4 )'),
+            "time_settings":(3,'Usage: time_settings main_time byo_yomi_time byo_yomi_stones'),
+            "time_left":(3,'Usage: time_left {b, w} time stones'),
             "showoptions":(0,'Usage: showoptions does not have arguments'),
             "feature_move":(1,'Usage: feature_move move')
         }
@@ -100,10 +115,38 @@ class GtpConnection():
         the user's input of commands.
         """
         self.debug_msg("Start up successful...\n\n")
-        line = sys.stdin.readline()
+        line = self.read_line()
         while line:
             self.get_cmd(line)
-            line = sys.stdin.readline()
+            line = self.read_line()
+
+    def read_line(self):
+        """
+        Read the next command. With pondering on, the engine searches the current position in a
+        background thread while waiting, and stops before the command is executed.
+        """
+        if not self.go_engine.pondering:
+            return sys.stdin.readline()
+        stop = threading.Event()
+        ponder = threading.Thread(target=self.ponder_thread,
+                                  args=(self.board.copy(), self.board.current_player, stop))
+        ponder.start()
+        line = sys.stdin.readline()
+        stop.set()
+        ponder.join()
+        return line
+
+    def ponder_thread(self, board, color, stop):
+        """
+        Body of the pondering thread: let the engine search board until stop is set. An error in
+        the thread cannot reach get_cmd, so it is written to the debug stream and pondering ends
+        until the next command.
+        """
+        try:
+            self.go_engine.ponder(board, color, stop)
+        except Exception as e:
+            self.debug_msg("Error while pondering {}\n".format(str(e)))
+            self.debug_msg("Stack Trace:\n{}\n".format(traceback.format_exc()))
 
     def get_cmd(self, command):
         """
@@ -185,6 +228,7 @@ class GtpConnection():
             the boardsize to reinitialize the state to
         """
         self.board.reset(size)
+        self.board.superko = bool(self.param_options["superko"])
         self.go_engine.reset()
 
     def protocol_version_cmd(self, args):
@@ -230,7 +274,16 @@ class GtpConnection():
         options['komi'] = self.go_engine.komi
         options['pattern'] = self.go_engine.pattern
         options['selfatari'] = self.go_engine.selfatari
+        options['superko'] = self.param_options['superko']
         options['num_sim'] = self.go_engine.num_simulation
+        options['num_workers'] = self.go_engine.num_workers
+        options['leaf_parallel'] = int(self.go_engine.leaf_parallel)
+        options['widening'] = int(self.go_engine.widening)
+        options['transpositions'] = int(self.go_engine.transpositions)
+        options['rave'] = int(self.go_engine.rave)
+        options['weighted'] = int(self.go_engine.weighted)
+        options['mercy'] = self.go_engine.mercy or 0
+        options['ponder'] = int(self.go_engine.pondering)
         self.respond(options)
         
     def komi_cmd(self, args):
@@ -292,19 +345,80 @@ class GtpConnection():
         self.go_engine.num_simulation = int(args[0])
         self.respond()
 
+    def num_workers_cmd(self, args):
+        num_workers = int(args[0])
+        if num_workers < 1:
+            self.error('Number of workers must be at least 1')
+            return
+        self.go_engine.num_workers = num_workers
+        self.respond()
+
+    def time_settings_cmd(self, args):
+        """
+        Set the time control: main time and a byo-yomi period of byo_yomi_time seconds for
+        byo_yomi_stones stones, all integers
+        """
+        try:
+            main_time, byo_yomi_time, byo_yomi_stones = [int(arg) for arg in args]
+        except ValueError:
+            self.error('Usage: time_settings main_time byo_yomi_time byo_yomi_stones')
+            return
+        self.go_engine.time_settings(main_time, byo_yomi_time, byo_yomi_stones)
+        self.respond()
+
+    def time_left_cmd(self, args):
+        """
+        Set the time left for a color: seconds and stones left in the byo-yomi period (0 in main time)
+        """
+        try:
+            color = GoBoardUtil.color_to_int(args[0].lower())
+            time_left, stones = int(args[1]), int(args[2])
+        except ValueError:
+            self.error('Usage: time_left {b, w} time stones')
+            return
+        self.go_engine.time_left(color, time_left, stones)
+        self.respond()
+
     def go_param_cmd(self, args):
         valid_values = [0,1]
-        valid_params = ['selfatari','pattern']
+        valid_params = ['selfatari','pattern','superko','leaf_parallel','widening','transpositions','rave','ponder','weighted','mercy']
         param = args[0]
-        param_value = int(args[1])
+        try:
+            param_value = int(args[1])
+        except ValueError:
+            self.error('Argument 2 ({}) must be an integer'.format(args[1]))
+            return
         if param not in valid_params:
             self.error('Unkown parameters: {}'.format(param))
-        if param_value not in valid_values:
+            return
+        if param == valid_params[9]:
+            # the stone margin that ends the rollouts, 0 turns the mercy rule off
+            if param_value < 0:
+                self.error('Argument 2 ({}) must be a non-negative integer'.format(param_value))
+                return
+        elif param_value not in valid_values:
             self.error('Argument 2 ({}) must be of type bool'.format(param_value))
+            return
         if param ==valid_params[1]:
             self.go_engine.pattern = param_value
         elif param == valid_params[0]:
             self.go_engine.selfatari = param_value
+        elif param == valid_params[2]:
+            self.board.superko = bool(param_value)
+        elif param == valid_params[3]:
+            self.go_engine.leaf_parallel = bool(param_value)
+        elif param == valid_params[4]:
+            self.go_engine.widening = bool(param_value)
+        elif param == valid_params[5]:
+            self.go_engine.transpositions = bool(param_value)
+        elif param == valid_params[6]:
+            self.go_engine.rave = bool(param_value)
+        elif param == valid_params[7]:
+            self.go_engine.pondering = bool(param_value)
+        elif param == valid_params[8]:
+            self.go_engine.weighted = bool(param_value)
+        elif param == valid_params[9]:
+            self.go_engine.mercy = param_value or None
         self.param_options[param] = param_value
         self.respond()
 
@@ -502,6 +616,9 @@ class GtpConnection():
                                                           self.board.ko_constraint))
             move = self.go_engine.get_move(self.board, color)
             if move is None:
+                # the engine tree already moved past the pass, the board follows so that both
+                # (and pondering) have the opponent to play
+                self.board.move(None, color)
                 self.respond("pass")
                 return
 
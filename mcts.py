@@ -3,125 +3,407 @@
 This function is loosely based on https://github.com/Rochester-NRT/RocAlphaGo/blob/develop/AlphaGo/mcts.py
 """
 
+import math
 import numpy as np
 import random
+import time
+import multiprocessing
+import queue
 from board_util import GoBoardUtil, BLACK, WHITE
 from feature import Feature
 from feature import Features_weight
+from rollout import RolloutEngine
 
-PASS = 'pass'
+# the tree stores the pass move as point 0, which is never on the board
+PASS = 0
+# seconds the leaf parallel search waits for a rollout result before it gives up on the workers
+ROLLOUT_TIMEOUT = 60
 
-def uct_val(node, child, exploration, max_flag):
-    if child._n_visits == 0:
-        return float("inf")
-    if max_flag:
-        return float(child._black_wins)/child._n_visits + exploration*np.sqrt(np.log(node._n_visits)/child._n_visits) + node._prob_simple_feature / (1.0 + node._n_visits)
+_pool = None
+_pool_size = 0
+
+def worker_pool(num_workers):
+    """
+    Return a process pool with num_workers processes. The pool is kept between calls and
+    only rebuilt when the number of workers changes.
+    """
+    global _pool, _pool_size
+    if _pool is None or _pool_size != num_workers:
+        if _pool is not None:
+            _pool.terminate()
+        if 'fork' in multiprocessing.get_all_start_methods():
+            # forked workers inherit the loaded modules and do not print the import messages again
+            context = multiprocessing.get_context('fork')
+        else:
+            context = multiprocessing.get_context()
+        _pool = context.Pool(num_workers)
+        _pool_size = num_workers
+    return _pool
+
+def reset_worker_pool():
+    """
+    Terminate the process pool, dropping the tasks still queued or running in it.
+    The next worker_pool call builds a new one.
+    """
+    global _pool, _pool_size
+    if _pool is not None:
+        _pool.terminate()
+    _pool = None
+    _pool_size = 0
+
+def root_parallel_search(args):
+    """
+    Worker of the root parallel search: grow an independent tree from board and return the
+    statistics of the root children as a list of (move, visits, black wins) and the number of playouts.
+    """
+    board, color, settings, num_simulation, time_budget, seed = args
+    random.seed(seed)
+    np.random.seed(seed % (2**32))
+    mcts = MCTS()
+    (mcts.komi, mcts.limit, mcts.selfatari, mcts.pattern, mcts.exploration, mcts.widening,
+     mcts.transpositions, mcts.rave, mcts.weighted, mcts.mercy) = settings
+    mcts.toplay = color
+    mcts._search(board, color, num_simulation, time_budget)
+    return mcts._root_stats(), mcts.num_playouts
+
+def leaf_rollout(args):
+    """
+    Worker of the leaf parallel search: play a rollout from board and return 1 if black wins, 0 otherwise,
+    and the array of moves played if they are recorded.
+    """
+    board, color, settings, seed = args
+    random.seed(seed)
+    komi, limit, selfatari, pattern, weighted, mercy, record = settings
+    result = RolloutEngine(board).play_game(color, komi=komi, limit=limit, selfatari=selfatari, pattern=pattern,
+                                            record=record, weighted=weighted, mercy=mercy)
+    if record:
+        winner, played = result
     else:
-        return float(child._n_visits - child._black_wins)/child._n_visits + exploration*np.sqrt(np.log(node._n_visits)/child._n_visits) + node._prob_simple_feature / (1.0 + node._n_visits)
+        winner, played = result, None
+    return int(winner == BLACK), played
+
+class NodeStore(object):
+    """The nodes of an MCTS tree, kept in preallocated NumPy arrays.
+    A node is an index into the arrays. Expanding a node reserves a block of num_candidates
+    nodes from first_child[node] for its candidate moves, ordered by prior; first_child is -1
+    while the node is not expanded. The first num_children nodes of the block are its children.
+    Candidates up to num_checked have been checked for legality, the legal ones were moved to
+    the front of the block. The arrays double in size when they are full.
 
-class TreeNode(object):
-    """A node in the MCTS tree.
+    amaf_visits and amaf_black_wins count the playouts in which the move of a node was played
+    later by the same player (all moves as first, AMAF).
+
+    With transpositions, table maps position keys (see MCTS._table_key) to nodes. A child whose position is already
+    in the tree links to that node (link >= 0) and shares its statistics and children; only its
+    move and prior are its own. table holds at most table_size entries.
     """
-    version = 0.1
-    name = "MCTS Player"
-    def __init__(self, parent):
+    # array name, dtype and value of a new node
+    fields = (('visits', np.int32, 0),
+              ('black_wins', np.int32, 0),
+              ('virtual_loss', np.int32, 0),
+              ('prior', np.float64, 1.0),
+              ('first_child', np.int32, -1),
+              ('num_children', np.int32, 0),
+              ('num_candidates', np.int32, 0),
+              ('num_checked', np.int32, 0),
+              ('move', np.int32, PASS),
+              ('link', np.int32, -1),
+              ('amaf_visits', np.int32, 0),
+              ('amaf_black_wins', np.int32, 0))
+
+    def __init__(self, capacity = 1024, table_size = 100000):
+        self.size = 0
+        for name, dtype, value in self.fields:
+            setattr(self, name, np.full(capacity, value, dtype=dtype))
+        self.table = {}
+        self.table_size = table_size
+
+    def allocate(self, n):
+        """Return the index of the first of n new consecutive nodes.
+        """
+        start = self.size
+        if start + n > len(self.visits):
+            capacity = len(self.visits)
+            while capacity < start + n:
+                capacity *= 2
+            for name, dtype, value in self.fields:
+                array = np.full(capacity, value, dtype=dtype)
+                array[:start] = getattr(self, name)[:start]
+                setattr(self, name, array)
+        self.size += n
+        return start
+
+    def is_expanded(self, node):
+        return self.first_child[node] >= 0
+
+    def is_leaf(self, node):
+        """Check if leaf node (i.e. no nodes below this have been expanded).
         """
-        parent is set when a node gets expanded
+        return self.num_children[node] == 0
+
+    def children(self, node):
+        first = int(self.first_child[node])
+        if first < 0:
+            return range(0)
+        return range(first, first + int(self.num_children[node]))
+
+    def child(self, node, move):
+        """Return the child of node reached by move, or None.
         """
-        self._parent = parent
-        self._children = {}  # a map from move to TreeNode
-        self._n_visits = 0
-        self._black_wins = 0
-        self._expanded = False
-        self._move = None
-        self._prob_simple_feature = 1.0
-
-    def expand(self, board, color):
-        """Expands tree by creating new children.
+        for child in self.children(node):
+            if self.move[child] == move:
+                return self.resolve(child)
+        return None
+
+    def child_nodes(self, node):
+        """Return the nodes holding the statistics of the children of the expanded node, as a slice
+        of the arrays or, when some children are transpositions, as an index array.
         """
-        gammas_sum = 0.0
-        moves = board.get_empty_points()
-        all_board_features = Feature.find_all_features(board)
-        for move in moves:
-            if move not in self._children:
-                if board.check_legal(move, color) and not board.is_eye(move, color):
-                    self._children[move] = TreeNode(self)
-                    self._children[move]._move = move
-                    if len(Features_weight) != 0:
-                        # when we have features weight, use that to compute knowledge (gamma) of each move
-                        assert move in all_board_features
-                        self._children[move]._prob_simple_feature = Feature.compute_move_gamma(Features_weight, all_board_features[move])
-                        gammas_sum += self._children[move]._prob_simple_feature
-
-        self._children[PASS] = TreeNode(self)
-        self._children[PASS]._move = move
-        
-        # when we have features weight, use that to compute knowledge (gamma) of each move
-        if len(Features_weight) != 0:
-            self._children[PASS]._prob_simple_feature = Feature.compute_move_gamma(Features_weight, all_board_features["PASS"])
-            gammas_sum += self._children[PASS]._prob_simple_feature
-        
-        # Normalize to get probability
-        if len(Features_weight) != 0 and gammas_sum != 0.0:
-            for move in moves:
-                if move not in self._children:
-                    if board.check_legal(move, color) and not board.is_eye(move, color):
-                        self._children[move]._prob_simple_feature = self._children[move]._prob_simple_feature / gammas_sum
-            self._children[PASS]._prob_simple_feature = self._children[PASS]._prob_simple_feature / gammas_sum
-        self._expanded = True
-
-    def select(self, exploration, max_flag):
+        first = int(self.first_child[node])
+        last = first + int(self.num_children[node])
+        links = self.link[first:last]
+        if links.max() >= 0:
+            # some children are transpositions, read their statistics from the linked nodes
+            return np.where(links >= 0, links, np.arange(first, last))
+        return slice(first, last)
+
+    def resolve(self, node):
+        """Return the node that holds the statistics of node.
+        """
+        link = int(self.link[node])
+        if link < 0:
+            return node
+        return link
+
+    def store(self, key, node):
+        """Enter node as the node of the position with hash key. When the table is full, the half
+        of the entries whose nodes have the fewest visits are dropped first.
+        """
+        if len(self.table) >= self.table_size:
+            keys = list(self.table)
+            nodes = np.fromiter(self.table.values(), dtype=np.int64, count=len(keys))
+            keep = np.argsort(-self.visits[nodes], kind='stable')[:len(keys) // 2]
+            self.table = {keys[i]: int(nodes[i]) for i in keep.tolist()}
+        self.table[key] = node
+
+    def uct_values(self, node, exploration, max_flag, rave_equivalence = 0):
+        """Return the UCT values of all children of node, computed on their slices of the arrays:
+        win_rate + C * sqrt(ln(parent_visits) / visits) + prior / (1 + visits)
+        where the priors (the gammas of the moves) are normalized over the children of node, the
+        candidates that were filtered out or are not children yet do not count.
+        Children without visits get infinity. Pending playouts of the leaf parallel search count
+        as lost visits (virtual loss).
+        With rave_equivalence > 0 the win rate is blended with the AMAF win rate (RAVE), with weight
+        beta = amaf_visits / (amaf_visits + visits + amaf_visits * visits / rave_equivalence)
+        """
+        first = int(self.first_child[node])
+        last = first + int(self.num_children[node])
+        nodes = self.child_nodes(node)
+        child_visits = self.visits[nodes]
+        visits = child_visits + self.virtual_loss[nodes]
+        if max_flag:
+            wins = self.black_wins[nodes]
+        else:
+            wins = child_visits - self.black_wins[nodes]
+        log_parent_visits = math.log(max(1, int(self.visits[node] + self.virtual_loss[node])))
+        prior = self.prior[first:last]
+        prior_sum = prior.sum()
+        if prior_sum > 0:
+            prior = prior / prior_sum
+        with np.errstate(divide='ignore', invalid='ignore'):
+            win_rate = wins / visits
+            if rave_equivalence > 0:
+                amaf_visits = self.amaf_visits[nodes]
+                if max_flag:
+                    amaf_wins = self.amaf_black_wins[nodes]
+                else:
+                    amaf_wins = amaf_visits - self.amaf_black_wins[nodes]
+                beta = amaf_visits / (amaf_visits + visits + amaf_visits * visits / rave_equivalence)
+                win_rate = (1 - beta) * win_rate + beta * np.where(amaf_visits > 0, amaf_wins / amaf_visits, 0)
+            values = (win_rate + exploration * np.sqrt(log_parent_visits / visits)
+                      + prior / (1.0 + child_visits))
+        values[visits == 0] = np.inf
+        return values
+
+    def select(self, node, exploration, max_flag, rave_equivalence = 0):
         """Select move among children that gives maximizes UCT. 
         If number of visits are zero for a node, value for that node is infinity so definitely will  gets selected
 
-        It uses: argmax(child_num_black_wins/child_num_vists + C * sqrt(2 * ln * Parent_num_vists/child_num_visits) )
         Returns:
-        A tuple of (move, next_node)
+        A tuple of (move, next_node), where next_node is the child or the node it links to
         """
-        return max(self._children.items(), key=lambda items:uct_val(self, items[1], exploration, max_flag))
+        values = self.uct_values(node, exploration, max_flag, rave_equivalence)
+        child = int(self.first_child[node]) + int(np.argmax(values))
+        return int(self.move[child]), self.resolve(child)
 
-    def update(self, leaf_value):
-        """Update node values from leaf evaluation.
+    def update_path(self, path, leaf_value):
+        """Update the values of all nodes on path, an array of node indices from the root to
+        the leaf, from the leaf evaluation.
         Arguments:
         leaf_value -- the value of subtree evaluation from the current player's perspective.
         
         Returns:
         None
         """
-        self._black_wins += leaf_value
-        self._n_visits += 1
+        self.visits[path] += 1
+        if leaf_value:
+            self.black_wins[path] += leaf_value
 
-    def update_recursive(self, leaf_value):
-        """Like a call to update(), but applied recursively for all ancestors.
-
-        Note: it is important that this happens from the root downward so that 'parent' visit
-        counts are correct.
+    def update_amaf(self, path, moves, color, played, leaf_value, maxpoint):
+        """Update the AMAF statistics of the children of the nodes on path.
+        moves are the moves played from the nodes on path, color is the color to play at the root
+        and played the (point, color) array of the rollout moves. A child is updated if its
+        move was first played, after its parent, by the player to move at the parent.
         """
-        # If it is not root, this node's parent should be updated first.
-        if self._parent:
-            self._parent.update_recursive(leaf_value)
-        self.update(leaf_value)
-
+        first_color = np.zeros(maxpoint, dtype=np.int16)
+        if len(played):
+            # the first time each point was played in the rollout
+            points, index = np.unique(played[:, 0], return_index=True)
+            first_color[points] = played[index, 1]
+        colors = [color, GoBoardUtil.opponent(color)]
+        for depth in range(len(path) - 1, -1, -1):
+            color = colors[depth % 2]
+            if depth < len(moves):
+                first_color[moves[depth]] = color
+            # pass is never updated
+            first_color[PASS] = 0
+            first = int(self.first_child[path[depth]])
+            if first < 0:
+                continue
+            children = np.arange(first, first + int(self.num_children[path[depth]]))
+            children = children[first_color[self.move[children]] == color]
+            links = self.link[children]
+            children = np.where(links >= 0, links, children)
+            self.amaf_visits[children] += 1
+            if leaf_value:
+                self.amaf_black_wins[children] += leaf_value
 
-    def is_leaf(self):
-        """Check if leaf node (i.e. no nodes below this have been expanded).
+    def subtree(self, root):
+        """Return a new NodeStore holding a copy of the subtree below root, with root at index 0.
+        A child linking to a node outside the subtree takes over the statistics and children of
+        that node.
         """
-        return self._children == {}
-
-    def is_root(self):
-        return self._parent is None
+        root = self.resolve(root)
+        # slots[i] is the node whose move and prior node i gets, nodes[i] the node whose
+        # statistics and children it gets. Every children block stays contiguous.
+        slots = [root]
+        nodes = [root]
+        link = [-1]
+        first_child = []
+        copied = {root: 0}
+        for i, node in enumerate(nodes):
+            first = int(self.first_child[node])
+            if first < 0 or link[i] >= 0:
+                first_child.append(-1)
+                continue
+            first_child.append(len(nodes))
+            for child in range(first, first + int(self.num_candidates[node])):
+                target = self.resolve(child)
+                slots.append(child)
+                if target in copied:
+                    nodes.append(child)
+                    link.append(copied[target])
+                else:
+                    copied[target] = len(nodes)
+                    nodes.append(target)
+                    link.append(-1)
+        tree = NodeStore(max(1024, len(nodes)), self.table_size)
+        tree.allocate(len(nodes))
+        for name in ('prior', 'move'):
+            getattr(tree, name)[:len(nodes)] = getattr(self, name)[slots]
+        for name in ('visits', 'black_wins', 'num_children', 'num_candidates', 'num_checked',
+                     'amaf_visits', 'amaf_black_wins'):
+            getattr(tree, name)[:len(nodes)] = getattr(self, name)[nodes]
+        tree.first_child[:len(nodes)] = first_child
+        tree.link[:len(nodes)] = link
+        tree.table = {key: copied[node] for key, node in self.table.items() if node in copied}
+        return tree
 
+    def nbytes(self):
+        """Memory used by the arrays of the store.
+        """
+        return sum(getattr(self, name).nbytes for name, _, _ in self.fields)
 
 class MCTS(object):
 
     def __init__(self):
-        self._root = TreeNode(None)
+        self._tree = NodeStore()
+        self._root = self._tree.allocate(1)
         self.init_color = BLACK
+        self.num_workers = 1
+        self.leaf_parallel = False
+        self.widening = True
+        self.transpositions = False
+        self.rave = False
+        self.weighted = False
+        self.mercy = None
+        self.num_playouts = 0
+        self.search_time = 0.0
+        self.num_pondered = 0
+        self._rollout = RolloutEngine()
+        # number of visits at which the AMAF and the real win rate get the same weight
+        self.rave_equivalence = 1000
+        # with progressive widening a node with n visits has 1 + log(1 + n) / log(widening_factor) children
+        self.widening_factor = 1.4
+        # playouts run even when the time budget is used up, so that the root has children to choose from
+        self.min_playouts = 10
+
+    def _expand(self, node, board, color):
+        """Expands tree by reserving the candidate moves of node: all empty points and pass,
+        in descending order of their gamma. They become children in _widen.
+        """
+        tree = self._tree
+        moves = board.get_empty_points()
+        # when we have features weight, use that to compute knowledge (gamma) of each move
+        if len(Features_weight) != 0:
+            board.current_player = color
+            all_board_features = Feature.find_all_features(board, moves)
+            gammas = [Feature.compute_move_gamma(Features_weight, all_board_features[move]) for move in moves]
+            gammas.append(Feature.compute_move_gamma(Features_weight, all_board_features["PASS"]))
+            # the priors are normalized over the children when they are used, see NodeStore.uct_values
+            gammas = np.array(gammas)
+        else:
+            gammas = np.ones(len(moves) + 1)
+        moves.append(PASS)
+        order = np.argsort(-gammas, kind='stable')
+        first = tree.allocate(len(moves))
+        tree.move[first:first + len(moves)] = np.array(moves)[order]
+        tree.prior[first:first + len(moves)] = gammas[order]
+        tree.first_child[node] = first
+        tree.num_candidates[node] = len(moves)
+
+    def _widen(self, node, board, color):
+        """Turn candidate moves of node into children, in order, until it has as many children as
+        its visit count allows. Only legal moves that do not fill an own eye become children.
+        Without progressive widening all candidates become children.
+        """
+        tree = self._tree
+        num_candidates = int(tree.num_candidates[node])
+        num_checked = int(tree.num_checked[node])
+        if num_checked == num_candidates:
+            return
+        num_children = int(tree.num_children[node])
+        if self.widening:
+            target = 1 + int(math.log(1 + int(tree.visits[node])) / math.log(self.widening_factor))
+        else:
+            target = num_candidates
+        first = int(tree.first_child[node])
+        while num_children < target and num_checked < num_candidates:
+            candidate = first + num_checked
+            move = int(tree.move[candidate])
+            num_checked += 1
+            if move == PASS or (board.check_legal(move, color) and not board.is_eye(move, color)):
+                child = first + num_children
+                tree.move[child] = move
+                tree.prior[child] = tree.prior[candidate]
+                num_children += 1
+        tree.num_children[node] = num_children
+        tree.num_checked[node] = num_checked
     
     def _playout(self, board, color):
         """Run a single playout from the root to the given depth, getting a value at the leaf and
-        propagating it back through its parents. State is modified in-place, so a copy must be
-        provided.
+        propagating it back along the path of selected nodes. State is modified in-place, so a
+        copy must be provided.
 
         Arguments:
         board -- a copy of the board.
@@ -131,41 +413,109 @@ class MCTS(object):
         Returns:
         None
         """
+        path, moves, leaf_color = self._select_leaf(board, color)
+        if self.rave:
+            leaf_value, played = self._evaluate_rollout(board, leaf_color, record=True)
+            self._tree.update_amaf(path, moves, color, played, leaf_value, board.maxpoint)
+        else:
+            leaf_value = self._evaluate_rollout(board, leaf_color)
+        # Update value and visit count of nodes in this traversal.
+        self._tree.update_path(path, leaf_value)
+
+    def _select_leaf(self, board, color, virtual_loss = False):
+        """Walk down the tree from the root playing the selected moves on board, until a node that
+        has not been visited before. Nodes on the way are expanded and widened as needed.
+        Return the path of nodes from the root to the leaf, the moves played from them and
+        the color to play at the leaf.
+        With virtual_loss, every node on the path gets a virtual loss until its playout is backed up.
+        With positional superko the legal moves depend on the moves that led to a position, not only
+        on the position, so nodes are not shared through the transposition table then.
+        """
+        tree = self._tree
         node = self._root 
-        # This will be True olny once for the root
-        if not node._expanded:
-            node.expand(board, color)
-        while not node.is_leaf():
+        path = [node]
+        moves = []
+        transpositions = self.transpositions and not board.superko
+        if transpositions and tree.visits[node] == 0:
+            tree.store(self._table_key(board), node)
+        while True:
+            if not tree.is_expanded(node):
+                # a leaf is only expanded on its second visit, most leaves are visited once
+                if node != self._root and tree.visits[node] == 0:
+                    break
+                self._expand(node, board, color)
+            self._widen(node, board, color)
             # Greedily select next move.                
             max_flag = color == self.init_color
-            move, next_node = node.select(self.exploration,max_flag)
+            move, node = tree.select(node, self.exploration, max_flag, self.rave_equivalence if self.rave else 0)
+            moves.append(move)
             if move!=PASS:
                 assert board.check_legal(move, color)
             if move == PASS:
                 move = None
             board.move(move, color)
             color = GoBoardUtil.opponent(color) 
-            node = next_node
-        assert node.is_leaf()
-        if not node._expanded:
-            node.expand(board, color)
+            if transpositions:
+                if node in path:
+                    # the move links back to a node on the path, the rollout starts from here
+                    break
+                if tree.visits[node] == 0 and tree.link[node] < 0:
+                    node = self._transpose(node, board, path)
+            path.append(node)
+        path = np.array(path)
+        if virtual_loss:
+            tree.virtual_loss[path] += 1
 
         board.current_player = color
-        leaf_value = self._evaluate_rollout(board, color)  
-        # Update value and visit count of nodes in this traversal.
-        node.update_recursive(leaf_value)
+        return path, moves, color
+
+    def _transpose(self, node, board, path):
+        """Look up the position on board, just reached through the new node, in the transposition
+        table. If another node has it, link node to that one and return it, otherwise enter node.
+        Nodes on path are not linked to, so that the path stays free of cycles.
+        """
+        tree = self._tree
+        key = self._table_key(board)
+        other = tree.table.get(key)
+        if other is None:
+            tree.store(key, node)
+            return node
+        if other == node or other in path:
+            return node
+        tree.link[node] = other
+        return other
 
-    def _evaluate_rollout(self, board, color):
-        """Use the rollout policy to play until the end of the game, returning +1 if the current
-        player wins, -1 if the opponent wins, and 0 if it is a tie.
+    @staticmethod
+    def _table_key(board):
+        """Return the transposition table key of the position on board: its hash, which leaves
+        out passes, and the number of passes just played (0, 1 or 2), since two passes end the game.
         """
-        winner = GoBoardUtil.playGame(board,
+        passes = 0
+        for move in reversed(board.moves[-2:]):
+            if move is not None:
+                break
+            passes += 1
+        return board.zobrist_hash(), passes
+
+    def _evaluate_rollout(self, board, color, record = False):
+        """Use the rollout policy to play until the end of the game, returning 1 if black wins
+        and 0 otherwise. With record, also return the array of the moves played.
+        The rollout is played by the RolloutEngine, board is not changed.
+        """
+        self._rollout.load(board)
+        result = self._rollout.play_game(
                 color,
                 komi=self.komi,
                 limit=self.limit,
                 selfatari=self.selfatari,
-                pattern=self.pattern)
-        if winner == BLACK:
+                pattern=self.pattern,
+                record=record,
+                weighted=self.weighted,
+                mercy=self.mercy)
+        if record:
+            winner, played = result
+            return int(winner == BLACK), played
+        if result == BLACK:
             return 1
         else:
             return 0
@@ -178,8 +528,30 @@ class MCTS(object):
             selfatari,
             pattern,
             num_simulation,
-            exploration):
-        """Runs all playouts sequentially and returns the most visited move.
+            exploration,
+            num_workers = 1,
+            leaf_parallel = False,
+            widening = True,
+            transpositions = False,
+            rave = False,
+            weighted = False,
+            mercy = None,
+            time_budget = None):
+        """Runs the playouts and returns the most visited move.
+        The search stops after num_simulation playouts or time_budget seconds, whichever comes
+        first (None means no limit), or earlier once the most visited move can no longer be
+        overtaken by the playouts that are left. At least min_playouts are run, see _best_move
+        for the move chosen after a search the clock cut short.
+        With leaf_parallel the rollouts run in num_workers processes while the tree stays here
+        (leaf parallel search). Otherwise with num_workers > 1 the playouts are split among that
+        many processes which grow their own trees (root parallel search).
+        widening turns progressive widening of the children on or off, transpositions the
+        sharing of nodes between positions reached through different move orders (not with
+        positional superko, see _select_leaf) and rave the
+        blending of AMAF statistics from the rollouts into the win rates.
+        weighted draws the rollout moves by their feature gammas, see rollout.RolloutEngine.
+        mercy ends the rollouts early once one color leads by that many stones or only eyes are
+        left, see GoBoardUtil.playGame (None plays them out).
         """
         self.komi = komi
         self.limit = limit
@@ -187,62 +559,254 @@ class MCTS(object):
         self.pattern = pattern
         self.toplay = color
         self.exploration = exploration
-        for n in range(num_simulation):
-            board_copy = board.copy()
-            self._playout(board_copy, color)
-        # choose a move that has the most visit 
-        moves_ls = [(move, node._n_visits) for move, node in self._root._children.items()]
-
-        if not moves_ls:
+        self.num_workers = num_workers
+        self.leaf_parallel = leaf_parallel
+        self.widening = widening
+        self.transpositions = transpositions
+        self.rave = rave
+        self.weighted = weighted
+        self.mercy = mercy
+        start = time.time()
+        if leaf_parallel:
+            self._leaf_parallel_search(board, color, num_simulation, time_budget)
+        elif num_workers > 1:
+            self._root_parallel_search(board, color, num_simulation, time_budget)
+        else:
+            self._search(board, color, num_simulation, time_budget)
+        self.search_time = time.time() - start
+        move = self._best_move(time_budget)
+        if move is None:
             return None
-        moves_ls = sorted(moves_ls,key=lambda i:i[1],reverse=True)
-        move = moves_ls[0]
         self.print_stat(board, self._root, color)
-        if move[0] == PASS:
+        if move == PASS:
             return None
-        assert board.check_legal(move[0], color)
-        return move[0]
+        assert board.check_legal(move, color)
+        return move
         
+    def _best_move(self, time_budget = None):
+        """Return the move of the most visited root child, or None if the root has no children.
+        When the clock stopped the search at about min_playouts, a pass with no more than
+        min_playouts visits is replaced by the most visited other move: a short search is no
+        reason to pass. Without a time budget the most visited move is always played.
+        """
+        tree = self._tree
+        children = tree.children(self._root)
+        if not children:
+            return None
+        visits = lambda child: tree.visits[tree.resolve(child)]
+        best = max(children, key=visits)
+        if (time_budget is not None and self.num_playouts <= 2 * self.min_playouts
+                and tree.move[best] == PASS and visits(best) <= self.min_playouts):
+            others = [child for child in children if tree.move[child] != PASS]
+            if others:
+                best = max(others, key=visits)
+        return int(tree.move[best])
+
+    def _search(self, board, color, num_simulation, time_budget = None):
+        """Run playouts from board one after another, reusing one scratch board, until _stop_search.
+        """
+        start = time.time()
+        board_copy = board.copy()
+        self.num_playouts = 0
+        while not self._stop_search(self.num_playouts, num_simulation, start, time_budget):
+            board.copy_into(board_copy)
+            self._playout(board_copy, color)
+            self.num_playouts += 1
+
+    def ponder(self, board, color, stop):
+        """Run playouts from board, growing the current tree, until the threading.Event stop is set.
+        """
+        board_copy = board.copy()
+        while not stop.is_set():
+            board.copy_into(board_copy)
+            self._playout(board_copy, color)
+            self.num_pondered += 1
+
+    def _stop_search(self, num_playouts, num_simulation, start, time_budget):
+        """Return True when num_simulation playouts are done, time_budget seconds have passed
+        since start, or the lead of the most visited root child over the second one is larger
+        than the number of playouts left. The playouts left in the time budget are estimated
+        from the playout rate so far. The time budget never stops the search before min_playouts.
+        """
+        if num_playouts < self.min_playouts and (num_simulation is None or num_playouts < num_simulation):
+            return False
+        remaining = []
+        if num_simulation is not None:
+            remaining.append(num_simulation - num_playouts)
+        if time_budget is not None:
+            elapsed = time.time() - start
+            if elapsed >= time_budget:
+                return True
+            if num_playouts > 0:
+                remaining.append(num_playouts * (time_budget - elapsed) / elapsed)
+        if not remaining:
+            return False
+        remaining = min(remaining)
+        if remaining <= 0:
+            return True
+        tree = self._tree
+        if not tree.is_expanded(self._root):
+            return False
+        visits = tree.visits[tree.child_nodes(self._root)]
+        if len(visits) >= 2:
+            second, best = np.partition(visits, -2)[-2:]
+        elif tree.num_checked[self._root] < tree.num_candidates[self._root]:
+            # a candidate that is not a child yet could still become one
+            best, second = visits[0], 0
+        else:
+            # the only move
+            return num_playouts > 0
+        return best - second > remaining
+
+    def _root_stats(self):
+        """Return the statistics of the root children as a list of (move, visits, black wins).
+        """
+        tree = self._tree
+        return [(int(tree.move[child]), int(tree.visits[tree.resolve(child)]), int(tree.black_wins[tree.resolve(child)]))
+                for child in tree.children(self._root)]
+
+    def _root_parallel_search(self, board, color, num_simulation, time_budget = None):
+        """Let every worker process grow its own tree from board with its own random seed,
+        then merge the visit and win counts of the root children into a new root.
+        """
+        settings = (self.komi, self.limit, self.selfatari, self.pattern, self.exploration, self.widening,
+                    self.transpositions, self.rave, self.weighted, self.mercy)
+        num_workers = self.num_workers
+        seed = random.getrandbits(32)
+        jobs = []
+        for i in range(num_workers):
+            # split the playouts as evenly as possible
+            if num_simulation is None:
+                n = None
+            else:
+                n = num_simulation // num_workers + (1 if i < num_simulation % num_workers else 0)
+            jobs.append((board, color, settings, n, time_budget, seed + i))
+        stats = {}
+        self.num_playouts = 0
+        for worker_stats, num_playouts in worker_pool(num_workers).map(root_parallel_search, jobs):
+            self.num_playouts += num_playouts
+            for move, visits, black_wins in worker_stats:
+                total_visits, total_black_wins = stats.get(move, (0, 0))
+                stats[move] = (total_visits + visits, total_black_wins + black_wins)
+        tree = NodeStore()
+        root = tree.allocate(1)
+        first = tree.allocate(len(stats))
+        tree.first_child[root] = first
+        tree.num_children[root] = len(stats)
+        tree.num_candidates[root] = len(stats)
+        tree.num_checked[root] = len(stats)
+        for child, (move, (visits, black_wins)) in enumerate(stats.items(), first):
+            tree.move[child] = move
+            tree.visits[child] = visits
+            tree.black_wins[child] = black_wins
+        tree.visits[root] = tree.visits[first:].sum()
+        tree.black_wins[root] = tree.black_wins[first:].sum()
+        self._tree = tree
+        self._root = root
+
+    def _leaf_parallel_search(self, board, color, num_simulation, time_budget = None):
+        """Keep 2 * num_workers rollouts running in the worker pool. Leaves are selected here with
+        virtual loss, so that pending playouts steer the selection away from their path, and every
+        result is backed up as soon as it arrives.
+        If a rollout raises in a worker, no more rollouts are started, the virtual losses of the
+        pending ones are taken back as they finish, and the exception is raised here.
+        If no result arrives for ROLLOUT_TIMEOUT seconds, the virtual losses of all pending
+        rollouts are taken back, the pool is terminated and a RuntimeError is raised.
+        """
+        settings = (self.komi, self.limit, self.selfatari, self.pattern, self.weighted, self.mercy, self.rave)
+        pool = worker_pool(self.num_workers)
+        results = queue.Queue()
+        seed = random.getrandbits(32)
+        tree = self._tree
+        start = time.time()
+        started = 0
+        # paths of the rollouts running in the pool, by their number
+        pending = {}
+        self.num_playouts = 0
+        stop = False
+        error = None
+        while True:
+            while not stop and len(pending) < 2 * self.num_workers:
+                # the pending playouts count as playouts left
+                stop = ((num_simulation is not None and started >= num_simulation)
+                        or self._stop_search(self.num_playouts, num_simulation, start, time_budget))
+                if stop:
+                    break
+                board_copy = board.copy()
+                path, moves, leaf_color = self._select_leaf(board_copy, color, virtual_loss=True)
+                # the callbacks run in a thread of the pool, they only pass the result or the error on
+                pool.apply_async(leaf_rollout, ((board_copy, leaf_color, settings, seed + started),),
+                                 callback=lambda result, index=started: results.put((index, result)),
+                                 error_callback=lambda e, index=started: results.put((index, e)))
+                pending[started] = (path, moves)
+                started += 1
+            if not pending:
+                break
+            try:
+                index, result = results.get(timeout=ROLLOUT_TIMEOUT)
+            except queue.Empty:
+                for path, _ in pending.values():
+                    tree.virtual_loss[path] -= 1
+                reset_worker_pool()
+                raise RuntimeError("no rollout result from the workers for {} seconds".format(ROLLOUT_TIMEOUT))
+            path, moves = pending.pop(index)
+            tree.virtual_loss[path] -= 1
+            if isinstance(result, BaseException):
+                error = error or result
+                stop = True
+                continue
+            leaf_value, played = result
+            self.num_playouts += 1
+            if self.rave:
+                tree.update_amaf(path, moves, color, played, leaf_value, board.maxpoint)
+            tree.update_path(path, leaf_value)
+        if error is not None:
+            raise error
+
     def update_with_move(self, last_move):
         """Step forward in the tree, keeping everything we already know about the subtree, assuming
-        that get_move() has been called already. Siblings of the new root will be garbage-collected.
+        that get_move() has been called already. The subtree is copied into a new store, so the
+        memory of its siblings is given back.
         """
-        if last_move in self._root._children:
-            self._root = self._root._children[last_move]
+        if last_move is None or last_move == 'pass':
+            last_move = PASS
+        child = self._tree.child(self._root, last_move)
+        if child is not None:
+            self._tree = self._tree.subtree(child)
         else:
-            self._root = TreeNode(None)
-        self._root._parent = None
+            self._tree = NodeStore()
+            self._tree.allocate(1)
+        self._root = 0
 
     def good_print(self, board, node, color, num_nodes):
+        tree = self._tree
         cboard = board.copy()
         print("\nTaking a tour of select in tree like in one of the playouts! \n")
         print(cboard.get_twoD_board())
-        if node._move != None:
-            pointString = board.point_to_string(move)
+        if node != self._root:
+            pointString = board.point_to_string(int(tree.move[node]))
         else:
             pointString = 'Root'
         print("\nMove: {} Numebr of children {}, Number of visits: {}"
-                .format(pointString,len(node._children),node._n_visits))
+                .format(pointString,tree.num_children[node],tree.visits[node]))
             
-        while not node.is_leaf():
-            moves_ls = []
+        while not tree.is_leaf(node):
             max_flag = color == BLACK
-            for move,child in node._children.items():
-                uctval = uct_val(node,child,exploration,max_flag)
-                moves_ls.append((move,uctval))
+            values = tree.uct_values(node,self.exploration,max_flag,self.rave_equivalence if self.rave else 0)
+            moves_ls = [(int(tree.move[child]),values[i],tree.resolve(child)) for i, child in enumerate(tree.children(node))]
             moves_ls = sorted(moves_ls,key=lambda i:i[1],reverse=max_flag)
             if moves_ls:
-                print("\nPrinting {} of {} childs that have highest UCT value \n".format(num_nodes, point))
-                for i in range(num_nodes):
+                print("\nPrinting {} of {} childs that have highest UCT value \n".format(num_nodes, len(moves_ls)))
+                for i in range(min(num_nodes, len(moves_ls))):
                     move = moves_ls[i][0]
                     child_val = moves_ls[i][1]
                     child_node = moves_ls[i][2]
                     print("\nChild point:{} ;UCT Value {}; Number of visits: {}; Number of Black wins: {}"
-                        .format(cboard.point_to_string(move), child_val, child_node._n_visits, child_node._black_wins))
+                        .format(cboard.point_to_string(None if move == PASS else move), child_val, tree.visits[child_node], tree.black_wins[child_node]))
                                                                       
              # Greedily select next move.
             max_flag = color == self.init_color
-            move, next_node = node.select(self.exploration,max_flag)
+            move, node = tree.select(node, self.exploration,max_flag,self.rave_equivalence if self.rave else 0)
             if move==PASS:
                 move = None
             assert cboard.check_legal(move, color)
@@ -251,27 +815,35 @@ class MCTS(object):
             print("\nboard in simulation after chosing child {} in tree.".format(string_point))
             print(cboard.get_twoD_board())
             color = GoBoardUtil.opponent(color)
-            node = next_node
-        assert node.is_leaf()
+        assert tree.is_leaf(node)
         cboard.current_player = color
         leaf_value = self._evaluate_rollout(cboard, color)
         print("\nWinner of simulation is: {} color, Black is 0 an".format(leaf_value))
 
     def print_stat(self, board, root, color):
+        tree = self._tree
         s_color = GoBoardUtil.int_to_color(color)
-        print("Numebr of children {}".format(len(root._children)))
-        print("Number of roots visits: {}".format(root._n_visits))
+        print("Numebr of children {}".format(tree.num_children[root]))
+        print("Number of roots visits: {}".format(tree.visits[root]))
+        if self.search_time > 0:
+            print("Playouts: {} in {:.2f}s, {:.0f} playouts per second".format(
+                self.num_playouts, self.search_time, self.num_playouts / self.search_time))
+        if self.num_pondered:
+            print("Playouts while pondering: {}".format(self.num_pondered))
+            self.num_pondered = 0
         stats=[]
-        for move,node in root._children.items():
+        for child in tree.children(root):
+            node = tree.resolve(child)
+            visits = int(tree.visits[node])
             if color == self.init_color:
-                wins = node._black_wins
+                wins = int(tree.black_wins[node])
             else:
-                wins = node._n_visits - node._black_wins
-            visits = node._n_visits
+                wins = visits - int(tree.black_wins[node])
             if visits:
                 win_rate = float(wins)/visits
             else:
                 win_rate = 0
+            move = int(tree.move[child])
             if move==PASS:
                 move = None
             pointString = board.point_to_string(move)
@@ -6,6 +6,9 @@
 
 from functools import reduce
 import collections
+import hashlib
+import os
+import numpy as np
 
 pat3src = [  # 3x3 playout patterns; X,O are colors, x,o are their inverses
            ["XOX",  # hane pattern - enclosing hane
@@ -79,10 +82,6 @@ def pat3_expand(pat):
             for p in [p, pat_swapcolors(p)]
             for p in pat_wildcards(''.join(p))]
 
-pat3list = [p.replace('O', 'x') for p in pat3src for p in pat3_expand(p)]
-
-pat3set = set(pat3list)
-
 def switch_color(pattern):
     p = pattern
     p=p.replace('x', 'O')
@@ -127,7 +126,112 @@ def generate_pattern_index():
         index = index+1
     return p_index
 
-patIndex = generate_pattern_index()
+def expand_patterns():
+    """
+    Expand pat3src into pat3list, pat3set and patIndex. This is slow, so it only runs when one
+    of them is used or when the lookup tables below have to be built.
+    """
+    global pat3list, pat3set, patIndex
+    pat3list = [p.replace('O', 'x') for p in pat3src for p in pat3_expand(p)]
+    pat3set = set(pat3list)
+    patIndex = generate_pattern_index()
+
+def __getattr__(name):
+    # module level pat3list, pat3set and patIndex are created on first use
+    if name in ('pat3list', 'pat3set', 'patIndex'):
+        expand_patterns()
+        return globals()[name]
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+"""
+Integer 3x3 pattern codes.
+The code of a point packs the colors of its 8 neighbors, 2 bits each, in the order
+NW, N, NE, W, E, SW, S, SE of board.GoBoard.neighborhood_33 (the center is skipped, it is always empty).
+GoBoard keeps the code of every point up to date, so matching a pattern is a table lookup:
+pat3_match_table[color, code] is 1 if the neighborhood matches a pattern for color to play, and
+pat3_index_table[color, code] is the pattern feature index (-1 if there is none).
+
+The tables are compiled once and saved next to this file. The file name has a version number and a
+digest of pat3src, so changing the patterns or the table layout makes a new cache file.
+Later imports map the file into memory and never expand the patterns.
+"""
+PAT3_NUM_CODES = 1 << 16
+PAT3_CACHE_VERSION = 1
+
+# colors as in board_util: EMPTY = 0, BLACK = 1, WHITE = 2, BORDER = 3
+_PAT3_COLORS = {1: {'X': 1, 'x': 2, '.': 0, ' ': 3},
+                2: {'X': 2, 'x': 1, '.': 0, ' ': 3}}
+
+def pat3_code(pattern, color):
+    """
+    Return the integer code of a 9 character pattern string seen by color to play.
+    """
+    code = 0
+    for i, c in enumerate(pattern[:4] + pattern[5:]):
+        code |= _PAT3_COLORS[color][c] << (2 * i)
+    return code
+
+def generate_pattern_tables():
+    """
+    Return an int16 array of shape (2, 3, PAT3_NUM_CODES): the match table and the index table,
+    indexed by color to play and pattern code.
+    """
+    tables = np.zeros((2, 3, PAT3_NUM_CODES), dtype=np.int16)
+    tables[1] = -1
+    if 'pat3set' not in globals():
+        expand_patterns()
+    for p in pat3set:
+        for color in (1, 2):
+            code = pat3_code(p, color)
+            tables[0, color, code] = 1
+            tables[1, color, code] = patIndex[p]
+    return tables
+
+def pattern_cache_file():
+    digest = hashlib.md5(repr(pat3src).encode()).hexdigest()[:8]
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "pat3_tables_v{}_{}.npy".format(PAT3_CACHE_VERSION, digest))
 
+def load_pattern_tables():
+    """
+    Load the tables from the cache file, building and saving them if the file does not exist.
+    """
+    filename = pattern_cache_file()
+    try:
+        tables = np.load(filename, mmap_mode='r')
+        if tables.shape == (2, 3, PAT3_NUM_CODES):
+            return tables.view(np.ndarray)
+    except (IOError, ValueError):
+        pass
+    tables = generate_pattern_tables()
+    try:
+        # write to a temporary file first so that other processes never see a partial file
+        tmp_filename = "{}.{}.npy".format(filename[:-len(".npy")], os.getpid())
+        np.save(tmp_filename, tables)
+        os.replace(tmp_filename, filename)
+    except (IOError, OSError):
+        pass
+    return tables
+
+pat3_tables = load_pattern_tables()
+pat3_match_table = pat3_tables[0]
+pat3_index_table = pat3_tables[1]
 
+def pat3_eyeish_table():
+    """
+    Return an int8 array over all pattern codes: the color of the stones on the four sides
+    (N, W, E, S) of the center point if they all have the same color, with the border counting
+    as any color, and 0 otherwise. This is GoBoard._is_eyeish as a table lookup.
+    """
+    codes = np.arange(PAT3_NUM_CODES)
+    sides = [(codes >> (2 * i)) & 3 for i in (1, 3, 4, 6)]
+    table = np.zeros(PAT3_NUM_CODES, dtype=np.int8)
+    for color in (1, 2):
+        eyeish = np.ones(PAT3_NUM_CODES, dtype=bool)
+        for c in sides:
+            eyeish &= (c == color) | (c == 3)
+        table[eyeish] = color
+    return table
 
+# only_eyes_left reads it for the empty points after every move of a mercy rule rollout, as a plain list
+pat3_eyeish_list = pat3_eyeish_table().tolist()
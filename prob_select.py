@@ -23,9 +23,78 @@ def random_select(distribution):
             return item
     return distribution[-1] # some numerical error, return last element
 
-drinks = [("Coffee", 0.3), ("Tea", 0.2), ("OJ", 0.4), ("Milk", 0.07), ("Milkshake", 0.03)]
-verify_weights(drinks)
+class SumTree(object):
+    """
+    Weights of the items 0..n-1 in a Fenwick tree (binary indexed tree), for sampling an item with
+    probability proportional to its weight when the weights keep changing.
+    Changing a weight and sampling both take O(log n) steps, instead of the O(n) scan of random_select.
+    The weights need not add up to 1 and do not have to be normalized.
+    """
 
-for _ in range(100):
-    item = random_select(drinks)
-    print(item[0])
+    def __init__(self, weights):
+        n = len(weights)
+        self.weights = [float(w) for w in weights]
+        # tree[i] is the sum of the weights of the items i - (i & -i) .. i - 1
+        tree = [0.0] + self.weights
+        for i in range(1, n + 1):
+            parent = i + (i & -i)
+            if parent <= n:
+                tree[parent] += tree[i]
+        self.tree = tree
+        self.n = n
+        self.top = 1 << (n.bit_length() - 1) if n else 0
+        self._total = sum(self.weights)
+
+    def total(self):
+        """Sum of all weights."""
+        return self._total
+
+    def update(self, index, weight):
+        """Set the weight of item index."""
+        delta = weight - self.weights[index]
+        if delta == 0.0:
+            return
+        self.weights[index] = weight
+        self._total += delta
+        tree = self.tree
+        n = self.n
+        i = index + 1
+        while i <= n:
+            tree[i] += delta
+            i += i & -i
+
+    def find(self, r):
+        """
+        Return the item where the running sum of the weights passes r, for 0 <= r < total().
+        """
+        tree = self.tree
+        n = self.n
+        pos = 0
+        step = self.top
+        while step:
+            i = pos + step
+            if i <= n and tree[i] <= r:
+                pos = i
+                r -= tree[i]
+            step >>= 1
+        # rounding can leave r at the end of the last item
+        return min(pos, n - 1)
+
+    def sample(self):
+        """Return an item drawn with probability proportional to its weight."""
+        return self.find(random.random() * self.total())
+
+if __name__ == '__main__':
+    drinks = [("Coffee", 0.3), ("Tea", 0.2), ("OJ", 0.4), ("Milk", 0.07), ("Milkshake", 0.03)]
+    verify_weights(drinks)
+
+    for _ in range(100):
+        item = random_select(drinks)
+        print(item[0])
+
+    tree = SumTree([p for _, p in drinks])
+    counts = [0] * len(drinks)
+    for _ in range(10000):
+        counts[tree.sample()] += 1
+    for (name, p), count in zip(drinks, counts):
+        print("{}: expected {:.3f} sampled {:.3f}".format(name, p, count / 10000))
@@ -0,0 +1,660 @@
+"""
+A light rollout engine. RolloutEngine copies a board into plain Python lists once and plays the
+whole rollout on them in place: there are no undo records, no NumPy element reads and no trial
+moves. Legality, eyes and the liberties a block would have after a move are answered from the
+block table, so the tactical tests of the policy never play a move to look at its result.
+
+The policy is the one of GoBoardUtil.generate_move_with_filter (atari capture and defense,
+3x3 patterns, random non-eye moves): in every position it generates the same candidate moves and
+filters them the same way, and it draws the same random numbers, so from an empty GoBoard
+RolloutEngine.play_game plays the same game as GoBoardUtil.playGame with the same seed.
+See rollout_check in benchmark.py.
+
+With weighted=True the pattern and random moves are replaced by moves drawn with probability
+proportional to their gamma from Features_weight. Only the features that depend on the 3x3
+neighborhood of a point (its line and its pattern) are used, so a move only changes the gammas
+of the points around the stones it adds and removes. The gammas of both colors are kept in
+prob_select.SumTree, so updating a gamma and drawing a move take O(log n) steps.
+"""
+
+import numpy as np
+import random
+from board_util import BLACK, WHITE, EMPTY, BORDER
+from pattern import pat3_match_table, pat3_index_table, pat3_eyeish_list
+from feature import Features_weight, FeBasicFeatures, NUM_SIMPLE_FEATURE
+from prob_select import SumTree
+
+# the pattern tables as lists, reading a list is much faster than reading a NumPy array
+_pat3_match_lists = {color: pat3_match_table[color].tolist() for color in (BLACK, WHITE)}
+
+_rollout_gammas = None
+
+def pat3_eye_table(color):
+    """
+    Return a boolean array over all 3x3 pattern codes (see pattern.py) that is True where the
+    center point is an eye of color, with the same rule as GoBoard.is_eye.
+    """
+    codes = np.arange(1 << 16)
+    # NW, N, NE, W, E, SW, S, SE
+    around = [(codes >> (2 * i)) & 3 for i in range(8)]
+    sides = [around[i] for i in (1, 3, 4, 6)]
+    corners = [around[i] for i in (0, 2, 5, 7)]
+    opp_color = BLACK + WHITE - color
+    eyeish = np.ones(len(codes), dtype=bool)
+    for c in sides:
+        eyeish &= (c == color) | (c == BORDER)
+    false_count = sum((c == opp_color).astype(int) for c in corners)
+    false_count += np.logical_or.reduce([c == BORDER for c in corners]).astype(int)
+    return eyeish & (false_count < 2)
+
+def rollout_gammas():
+    """
+    Return the gammas used by the weighted rollout policy, built on first use:
+    the gamma of every 3x3 pattern code for each color to play, and the gamma of lines 1 to 3
+    (index 0 is unused). All gammas are 1.0 if there is no features weight file.
+    Codes where the point is an eye of the color to play get gamma 0, the policy never fills its eyes.
+    """
+    global _rollout_gammas
+    if _rollout_gammas is None:
+        if len(Features_weight) == 0:
+            weights = [1.0] * (NUM_SIMPLE_FEATURE + int(pat3_index_table.max()) + 1)
+        else:
+            weights = Features_weight.tolist()
+        pattern_gammas = {}
+        for color in (BLACK, WHITE):
+            gammas = [weights[index + NUM_SIMPLE_FEATURE] if index >= 0 else 1.0
+                      for index in pat3_index_table[color].tolist()]
+            for code in np.flatnonzero(pat3_eye_table(color)).tolist():
+                gammas[code] = 0.0
+            pattern_gammas[color] = gammas
+        first_line = FeBasicFeatures["FE_LINE_1"]
+        line_gammas = [1.0] + weights[first_line:first_line + 3]
+        _rollout_gammas = (pattern_gammas, line_gammas)
+    return _rollout_gammas
+
+class RolloutEngine(object):
+    """
+    Position of a rollout: the colors of all points, a block table and the empty point list,
+    kept in the same layout as GoBoard. stones[anchor] and libs[anchor] are the stones and the
+    liberty set of the block with that anchor, block_of[point] is the anchor of the block at point.
+    Unlike GoBoard the lists and sets are changed in place.
+    """
+
+    __slots__ = ('color', 'block_of', 'stones', 'libs', 'empty', 'empty_index', 'pat3_code',
+                 'ko', 'last_move', 'last2_move', 'current_player', 'check_suicide', 'superko',
+                 'hash', 'hash_history', 'stone_keys', 'passes_black', 'passes_white',
+                 'points', 'neighbors', 'diag_neighbors', 'neighbors_8', 'line', 'trees', 'point_gammas')
+
+    def __init__(self, board=None):
+        if board is not None:
+            self.load(board)
+
+    def load(self, board):
+        """
+        Copy the position of board, a GoBoard, into the engine.
+        The board itself is not changed by the rollout.
+        """
+        geometry = board._geometry
+        self.points = geometry.points
+        self.neighbors = geometry.neighbors
+        self.diag_neighbors = geometry.diag_neighbors
+        self.neighbors_8 = geometry.neighbors_8
+        self.line = geometry.line
+        # gamma trees of the weighted policy, built by play_game when they are needed
+        self.trees = None
+        self.color = color = board.board.tolist()
+        self.empty = board._empty_points[:]
+        self.empty_index = board._empty_index[:]
+        self.pat3_code = board._pat3_code[:]
+        self.ko = board.ko_constraint
+        self.last_move = board.last_move
+        self.last2_move = board.last2_move
+        self.current_player = board.current_player
+        self.check_suicide = board.check_suicide
+        self.superko = board.superko
+        self.hash = board._hash
+        self.hash_history = set(board._hash_history)
+        self.stone_keys = board._zobrist[0]
+        self.passes_black = board.passes_black
+        self.passes_white = board.passes_white
+        # build the block table from the colors, as lists and sets that the rollout changes in place
+        neighbors = self.neighbors
+        self.block_of = block_of = [None] * len(color)
+        self.stones = {}
+        self.libs = {}
+        for p in self.points:
+            c = color[p]
+            if c == EMPTY or block_of[p] is not None:
+                continue
+            block = [p]
+            block_libs = set()
+            block_of[p] = p
+            i = 0
+            while i < len(block):
+                for n in neighbors[block[i]]:
+                    if color[n] == EMPTY:
+                        block_libs.add(n)
+                    elif color[n] == c and block_of[n] is None:
+                        block_of[n] = p
+                        block.append(n)
+                i += 1
+            self.stones[p] = block
+            self.libs[p] = block_libs
+
+    def play_game(self, color, komi=0, limit=1000, selfatari=True, pattern=True, record=False, weighted=False,
+                  mercy=None):
+        """
+        Play a rollout with color to move, like GoBoardUtil.playGame, and return the winner.
+        With record=True return the winner and the moves played, as an int16 array with one
+        (point, color) row per move; a pass is recorded as point 0.
+        With weighted=True the moves after the atari moves are drawn by their gamma.
+        With mercy=n the rollout ends early as in GoBoardUtil.playGame, once the stone margin
+        reaches n or once only_eyes_left().
+        """
+        if weighted and self.trees is None:
+            self._build_trees()
+        if mercy:
+            margin = 0
+            for anchor, stones in self.stones.items():
+                margin += len(stones) if self.color[anchor] == BLACK else -len(stones)
+        num_pass = 0
+        played = []
+        for _ in range(limit):
+            move = self.generate_move(pattern, selfatari, weighted)
+            if move != None:
+                num_empty = len(self.empty)
+                self.play(move, color)
+                num_pass = 0
+            else:
+                self.play_pass()
+                num_pass += 1
+            if record:
+                played.append((move or 0, color))
+            if num_pass == 2:
+                break
+            if mercy and move != None:
+                # the stone played and the stones captured, which are empty again
+                gain = 1 + len(self.empty) - (num_empty - 1)
+                margin += gain if color == BLACK else -gain
+                if abs(margin) >= mercy or self.only_eyes_left():
+                    break
+            color = BLACK + WHITE - color
+        score = self.score(komi)
+        winner = BLACK if score > 0 else WHITE if score < 0 else EMPTY
+        if record:
+            return winner, np.array(played, dtype=np.int16).reshape(-1, 2)
+        return winner
+
+    """
+    ----------------------------------------------------------------------------------------------------------------------
+    rollout policy, see GoBoardUtil.generate_move_with_filter
+    ----------------------------------------------------------------------------------------------------------------------
+    """
+    def generate_move(self, use_pattern, check_selfatari, weighted=False):
+        """
+        Return the policy move for the player to move, or None to pass.
+        """
+        move = self._choose(self.atari_moves(), check_selfatari)
+        if move:
+            return move
+        if weighted:
+            move = self.weighted_move(check_selfatari)
+        elif use_pattern:
+            move = self._choose(self.pattern_moves(), check_selfatari)
+        if move == None:
+            move = self.random_move()
+        return move
+
+    def _choose(self, moves, check_selfatari):
+        """
+        Remove random moves from the list until one passes the filter, and return it (or None).
+        """
+        color = self.current_player
+        while moves:
+            candidate = random.choice(moves)
+            if (not self.is_legal(candidate, color) or self.is_eye(candidate, color)
+                    or (check_selfatari and self.is_selfatari(candidate, color))):
+                moves.remove(candidate)
+            else:
+                return candidate
+        return None
+
+    def atari_moves(self):
+        """
+        Capture the last move if it is in atari, otherwise save the own blocks it put in atari,
+        see GoBoardUtil.generate_atari_moves and GoBoardUtil.atari_defence.
+        """
+        last = self.last_move
+        if not last:
+            return []
+        color = self.current_player
+        opp_color = BLACK + WHITE - color
+        _, last_lib = self._liberty_point(last, opp_color)
+        if last_lib and self.is_legal(last_lib, color):
+            return [last_lib]
+        moves = []
+        color_of = self.color
+        for n in self.neighbors[last]:
+            if color_of[n] == color:
+                _, lib = self._liberty_point(n, color)
+                if lib:
+                    # run away
+                    if self.is_legal(lib, color) and self.liberties_after(lib, color, lib) > 1:
+                        moves.append(lib)
+                    # capture a neighbor of the stone in atari
+                    for m in self.neighbors[n]:
+                        if color_of[m] == opp_color:
+                            _, opp_lib = self._liberty_point(m, opp_color)
+                            if (opp_lib and self.is_legal(opp_lib, color)
+                                    and self.liberties_after(opp_lib, color, n) > 1):
+                                moves.append(opp_lib)
+        return moves
+
+    def pattern_moves(self):
+        """
+        Empty points around the last two moves that match a 3x3 pattern for the player to move.
+        """
+        color_of = self.color
+        points = []
+        for c in self.last_move, self.last2_move:
+            if c is None:
+                continue
+            for d in self.neighbors[c] + self.diag_neighbors[c]:
+                if color_of[d] == EMPTY and d not in points:
+                    points.append(d)
+        match = _pat3_match_lists[self.current_player]
+        codes = self.pat3_code
+        return [p for p in points if match[codes[p]]]
+
+    def weighted_move(self, check_selfatari):
+        """
+        Draw moves by their gamma until one is legal, does not fill an own eye and, with
+        check_selfatari, is not a self-atari. The rejected points are left out of the following
+        draws and put back afterwards. Return None if all points are rejected.
+        """
+        color = self.current_player
+        tree = self.trees[color]
+        rejected = []
+        move = None
+        while tree.total() > 1e-12:
+            point = tree.sample()
+            if tree.weights[point] == 0.0:
+                # only rounding error is left of the total
+                break
+            if (not self.is_legal(point, color) or self.is_eye(point, color)
+                    or (check_selfatari and self.is_selfatari(point, color))):
+                rejected.append((point, tree.weights[point]))
+                tree.update(point, 0.0)
+            else:
+                move = point
+                break
+        for point, weight in rejected:
+            tree.update(point, weight)
+        return move
+
+    def _build_trees(self):
+        """
+        Build the gamma tree of each color over all points, non empty points have weight 0.
+        """
+        pattern_gammas, line_gammas = rollout_gammas()
+        self.point_gammas = [line_gammas[min(3, line)] for line in self.line]
+        codes = self.pat3_code
+        self.trees = {}
+        for color in (BLACK, WHITE):
+            weights = [0.0] * len(self.color)
+            gammas = pattern_gammas[color]
+            for p in self.empty:
+                weights[p] = self.point_gammas[p] * gammas[codes[p]]
+            self.trees[color] = SumTree(weights)
+
+    def _update_trees(self, point):
+        """
+        Update the gammas of point and the empty points around it after its color changed.
+        """
+        color_of = self.color
+        codes = self.pat3_code
+        point_gammas = self.point_gammas
+        pattern_gammas = rollout_gammas()[0]
+        for color in (BLACK, WHITE):
+            tree = self.trees[color]
+            gammas = pattern_gammas[color]
+            if color_of[point] == EMPTY:
+                tree.update(point, point_gammas[point] * gammas[codes[point]])
+            else:
+                tree.update(point, 0.0)
+            for p in self.neighbors_8[point]:
+                if color_of[p] == EMPTY:
+                    tree.update(p, point_gammas[p] * gammas[codes[p]])
+
+    def random_move(self):
+        """
+        A random legal move which does not fill an own eye, see GoBoardUtil.generate_random_move.
+        """
+        color = self.current_player
+        empty = self.empty
+        for _ in range(min(10, len(empty))):
+            move = empty[random.randrange(len(empty))]
+            if self.is_legal(move, color) and not self.is_eye(move, color):
+                return move
+        moves = sorted(empty)
+        while len(moves) > 0:
+            index = random.randint(0, len(moves) - 1)
+            move = moves[index]
+            if self.is_legal(move, color) and not self.is_eye(move, color):
+                return move
+            moves[index] = moves[-1]
+            moves.pop()
+        return None
+
+    """
+    ----------------------------------------------------------------------------------------------------------------------
+    queries
+    ----------------------------------------------------------------------------------------------------------------------
+    """
+    def is_legal(self, point, color):
+        if self.color[point] != EMPTY or point == self.ko:
+            return False
+        if self.check_suicide and self._is_suicide(point, color):
+            return False
+        return not (self.superko and self._is_superko(point, color))
+
+    def _is_suicide(self, point, color):
+        color_of = self.color
+        for n in self.neighbors[point]:
+            c = color_of[n]
+            if c == EMPTY:
+                return False
+            if c == BORDER:
+                continue
+            num_libs = len(self.libs[self.block_of[n]])
+            if c == color:
+                if num_libs > 1:
+                    return False
+            elif num_libs == 1:
+                return False
+        return True
+
+    def _is_superko(self, point, color):
+        opp_color = BLACK + WHITE - color
+        h = self.hash ^ self.stone_keys[color][point]
+        captured = []
+        for n in self.neighbors[point]:
+            if self.color[n] == opp_color:
+                a = self.block_of[n]
+                if a not in captured and len(self.libs[a]) == 1:
+                    captured.append(a)
+                    for s in self.stones[a]:
+                        h ^= self.stone_keys[opp_color][s]
+        return h in self.hash_history
+
+    def _is_eyeish(self, point):
+        eye_color = None
+        for n in self.neighbors[point]:
+            c = self.color[n]
+            if c == BORDER:
+                continue
+            if c == EMPTY:
+                return None
+            if eye_color == None:
+                eye_color = c
+            elif c != eye_color:
+                return None
+        return eye_color
+
+    def is_eye(self, point, color):
+        """
+        Return color if point is an eye of color, None otherwise, see GoBoard.is_eye.
+        """
+        if self._is_eyeish(point) != color:
+            return None
+        false_color = BLACK + WHITE - color
+        false_count = 0
+        at_edge = False
+        for d in self.diag_neighbors[point]:
+            c = self.color[d]
+            if c == BORDER:
+                at_edge = True
+            elif c == false_color:
+                false_count += 1
+        if at_edge:
+            false_count += 1
+        if false_count >= 2:
+            return None
+        return color
+
+    def only_eyes_left(self):
+        """
+        Whether every empty point is surrounded by a single color and no block is in atari,
+        see GoBoard.only_eyes_left.
+        """
+        eyeish = pat3_eyeish_list
+        codes = self.pat3_code
+        for p in self.empty:
+            if not eyeish[codes[p]]:
+                return False
+        for libs in self.libs.values():
+            if len(libs) == 1:
+                return False
+        return True
+
+    def is_selfatari(self, point, color):
+        """
+        Whether the legal move of color at point leaves its block with a single liberty.
+        """
+        return self.liberties_after(point, color, point) == 1
+
+    def _liberty_point(self, point, color):
+        """
+        Number of liberties of the block of color at point, and the liberty if it is the only one.
+        """
+        if self.color[point] == color:
+            libs = self.libs[self.block_of[point]]
+            if len(libs) == 1:
+                for single_lib_point in libs:
+                    return 1, single_lib_point
+            return len(libs), None
+        return self._liberty_point_flood(point, color)
+
+    def _liberty_point_flood(self, point, color):
+        """
+        GoBoard._liberty_point_flood, for a point which does not hold a stone of color.
+        """
+        color_of = self.color
+        group_points = [point]
+        liberty = 0
+        single_lib_point = None
+        met_points = [point]
+        while group_points:
+            p = group_points.pop()
+            met_points.append(p)
+            for n in self.neighbors[p]:
+                if n not in met_points:
+                    if color_of[n] == BORDER:
+                        continue
+                    if color_of[n] == color:
+                        group_points.append(n)
+                    elif color_of[n] == EMPTY:
+                        liberty += 1
+                        single_lib_point = n
+                    met_points.append(n)
+        if liberty == 1:
+            return liberty, single_lib_point
+        return liberty, None
+
+    def liberties_after(self, point, color, stone):
+        """
+        Number of liberties the block of stone would have after color plays the legal move at point,
+        computed from the block table without playing the move.
+        stone is point itself or a stone of color.
+        """
+        color_of = self.color
+        block_of = self.block_of
+        neighbors = self.neighbors
+        opp_color = BLACK + WHITE - color
+        own = []
+        captured = []
+        empties = []
+        for n in neighbors[point]:
+            c = color_of[n]
+            if c == EMPTY:
+                empties.append(n)
+            elif c == color:
+                if block_of[n] not in own:
+                    own.append(block_of[n])
+            elif c == opp_color:
+                a = block_of[n]
+                if len(self.libs[a]) == 1 and a not in captured:
+                    captured.append(a)
+        if stone == point or block_of[stone] in own:
+            # the block of the new stone
+            libs = set(empties)
+            for a in own:
+                libs |= self.libs[a]
+            libs.discard(point)
+            block = own
+            adjacent = point
+        else:
+            a = block_of[stone]
+            libs = self.libs[a]
+            block = [a]
+            adjacent = None
+        if captured:
+            libs = set(libs)
+            for a in captured:
+                for s in self.stones[a]:
+                    for n in neighbors[s]:
+                        if n == adjacent or block_of[n] in block:
+                            libs.add(s)
+                            break
+        return len(libs)
+
+    def score(self, komi):
+        """
+        Area score, the margin of black over white, as in GoBoard.score.
+        """
+        color_of = self.color
+        neighbors = self.neighbors
+        score = 0
+        for p in self.points:
+            c = color_of[p]
+            if c == BLACK:
+                score += 1
+            elif c == WHITE:
+                score -= 1
+            else:
+                eye_color = self._is_eyeish(p)
+                if eye_color == BLACK:
+                    score += 1
+                elif eye_color == WHITE:
+                    score -= 1
+        return score - komi + self.passes_white - self.passes_black
+
+    """
+    ----------------------------------------------------------------------------------------------------------------------
+    playing moves
+    ----------------------------------------------------------------------------------------------------------------------
+    """
+    def play_pass(self):
+        self.current_player = BLACK + WHITE - self.current_player
+        self.last2_move = self.last_move
+        self.last_move = None
+
+    def play(self, point, color):
+        """
+        Play the legal move of color at point, merging blocks and removing captured blocks in place.
+        """
+        color_of = self.color
+        block_of = self.block_of
+        opp_color = BLACK + WHITE - color
+        in_enemy_eye = self._is_eyeish(point) == opp_color
+        own = []
+        opp = []
+        libs = set()
+        for n in self.neighbors[point]:
+            c = color_of[n]
+            if c == EMPTY:
+                libs.add(n)
+            elif c == color:
+                if block_of[n] not in own:
+                    own.append(block_of[n])
+            elif c == opp_color:
+                if block_of[n] not in opp:
+                    opp.append(block_of[n])
+        self._set_stone(point, color)
+        # merge into the largest neighbor block, the stones are kept in the order GoBoard uses
+        anchor = point
+        stones = [point]
+        if own:
+            anchor = max(own, key=lambda a: len(self.stones[a]))
+            stones += self.stones[anchor]
+            libs |= self.libs[anchor]
+            for a in own:
+                if a == anchor:
+                    continue
+                for s in self.stones[a]:
+                    block_of[s] = anchor
+                stones += self.stones.pop(a)
+                libs |= self.libs.pop(a)
+            libs.discard(point)
+        block_of[point] = anchor
+        self.stones[anchor] = stones
+        self.libs[anchor] = libs
+        single_captures = []
+        for a in opp:
+            opp_libs = self.libs[a]
+            opp_libs.discard(point)
+            if not opp_libs:
+                captured = self._remove_block(a)
+                if len(captured) == 1:
+                    single_captures.append(captured[0])
+        self.ko = single_captures[0] if in_enemy_eye and len(single_captures) == 1 else None
+        self.current_player = opp_color
+        self.last2_move = self.last_move
+        self.last_move = point
+        if self.superko:
+            self.hash_history.add(self.hash)
+
+    def _remove_block(self, anchor):
+        stones = self.stones.pop(anchor)
+        del self.libs[anchor]
+        block_of = self.block_of
+        for s in stones:
+            self._clear_stone(s)
+            block_of[s] = None
+        for s in stones:
+            for n in self.neighbors[s]:
+                a = block_of[n]
+                if a is not None:
+                    self.libs[a].add(s)
+        return stones
+
+    def _set_stone(self, point, color):
+        self.color[point] = color
+        self.hash ^= self.stone_keys[color][point]
+        i = self.empty_index[point]
+        last = self.empty.pop()
+        if last != point:
+            self.empty[i] = last
+            self.empty_index[last] = i
+        self.empty_index[point] = -1
+        codes = self.pat3_code
+        shift = 14
+        for n in self.neighbors_8[point]:
+            codes[n] += color << shift
+            shift -= 2
+        if self.trees is not None:
+            self._update_trees(point)
+
+    def _clear_stone(self, point):
+        color = self.color[point]
+        self.hash ^= self.stone_keys[color][point]
+        self.color[point] = EMPTY
+        self.empty_index[point] = len(self.empty)
+        self.empty.append(point)
+        codes = self.pat3_code
+        shift = 14
+        for n in self.neighbors_8[point]:
+            codes[n] -= color << shift
+            shift -= 2
+        if self.trees is not None:
+            self._update_trees(point)